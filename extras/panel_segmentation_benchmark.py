@@ -0,0 +1,90 @@
+# Times the kumiko and opencv panel segmenters on some sample pages and reports how
+# well their panels agree.
+#
+# Usage: python panel_segmentation_benchmark.py [--min-iou 0.8] <image-file-or-dir>...
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from barks_fantagraphics.comics_info import JPG_FILE_EXT, PNG_FILE_EXT
+from barks_fantagraphics.opencv_panel_segmentation import OpenCvPanelSegmentation
+from barks_fantagraphics.panel_segmentation import (
+    KumikoPanelSegmentation,
+    KumikoWorkerPool,
+    PanelSegmenter,
+    PanelsAgreement,
+    get_panels_agreement,
+)
+
+
+def get_image_files(paths: List[str]) -> List[str]:
+    image_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            image_files.extend(
+                os.path.join(path, f)
+                for f in sorted(os.listdir(path))
+                if os.path.splitext(f)[1] in [JPG_FILE_EXT, PNG_FILE_EXT]
+            )
+        else:
+            image_files.append(path)
+
+    return image_files
+
+
+def get_all_panels(
+    segmenter: PanelSegmenter, image_files: List[str]
+) -> Tuple[Dict[str, List[List[int]]], float]:
+    start = time.time()
+    all_panels = {
+        image_file: segmenter.get_panels_segment_info(None, image_file)["panels"]
+        for image_file in image_files
+    }
+
+    return all_panels, time.time() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark panel segmenters.")
+    parser.add_argument("--min-iou", type=float, default=0.8)
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    image_files = get_image_files(args.paths)
+    if not image_files:
+        raise Exception("No sample pages found.")
+
+    with tempfile.TemporaryDirectory() as work_dir, KumikoWorkerPool() as worker_pool:
+        kumiko = KumikoPanelSegmentation(work_dir, worker_pool)
+        kumiko_panels, kumiko_secs = get_all_panels(kumiko, image_files)
+    opencv_panels, opencv_secs = get_all_panels(OpenCvPanelSegmentation(), image_files)
+
+    agreements: List[PanelsAgreement] = []
+    for image_file in image_files:
+        agreement = get_panels_agreement(
+            kumiko_panels[image_file], opencv_panels[image_file], args.min_iou
+        )
+        agreements.append(agreement)
+        print(
+            f"{os.path.basename(image_file)}: kumiko {agreement.num_panels_a},"
+            f" opencv {agreement.num_panels_b}, matched {agreement.num_matched},"
+            f" mean iou {agreement.mean_iou:.3f}"
+        )
+
+    num_pages = len(image_files)
+    num_full_agreements = sum(1 for a in agreements if a.is_full_agreement())
+    print()
+    print(f"Pages:  {num_pages}")
+    print(f"kumiko: {kumiko_secs:.2f}s ({kumiko_secs / num_pages:.3f}s per page)")
+    print(f"opencv: {opencv_secs:.2f}s ({opencv_secs / num_pages:.3f}s per page)")
+    print(
+        f"Full agreement (iou >= {args.min_iou}):"
+        f" {num_full_agreements}/{num_pages} ({100.0 * num_full_agreements / num_pages:.1f}%)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from .comics_consts import CATALOG_CACHE_SUBDIR
+from .comics_image_io import get_bw_image_from_alpha_in_strips
+from .comics_utils import get_file_sha1, get_relpath, write_json_file
+
+BW_MASK_CACHE_SUBDIR = "bw-masks"
+BW_MASK_CACHE_FORMAT_VERSION = 1
+BW_MASK_THRESHOLD = 128
+
+# Number of set bits for each byte value.
+_BYTE_POPCOUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+# A binary mask stored eight pixels to a byte, row by row (see 'np.packbits'). The
+# packed array may be a read-only memory map of the cache file, so unpacking is only
+# done when asked for, and counting works directly on the packed bytes.
+class PackedMask:
+    def __init__(self, packed: np.ndarray, shape: Tuple[int, int]):
+        assert packed.shape == (shape[0], (shape[1] + 7) // 8)
+        self._packed = packed
+        self._shape = shape
+
+    @staticmethod
+    def from_mask(mask: cv.typing.MatLike, threshold: int = BW_MASK_THRESHOLD) -> "PackedMask":
+        return PackedMask(np.packbits(mask >= threshold, axis=1), mask.shape)
+
+    def get_shape(self) -> Tuple[int, int]:
+        return self._shape
+
+    def get_packed(self) -> np.ndarray:
+        return self._packed
+
+    # Unpacks to a uint8 mask with values 0 and 255.
+    def unpack(self) -> np.ndarray:
+        return self.unpack_rows(0, self._shape[0])
+
+    def unpack_rows(self, start: int, stop: int) -> np.ndarray:
+        bits = np.unpackbits(self._packed[start:stop], axis=1, count=self._shape[1])
+        return bits * np.uint8(255)
+
+    # The pad bits at the end of each packed row are always zero, so they don't count.
+    def count_nonzero(self) -> int:
+        return int(_BYTE_POPCOUNTS[self._packed].sum(dtype=np.int64))
+
+    def get_row_counts(self) -> np.ndarray:
+        return _BYTE_POPCOUNTS[self._packed].sum(axis=1, dtype=np.int64)
+
+
+@dataclass
+class BwMaskCacheEntry:
+    format_version: int
+    srce_file: str
+    size: int
+    mtime_ns: int
+    sha1: str
+    shape: Tuple[int, int]
+    threshold: int
+
+
+def get_bw_mask_cache_dir(database_dir: str) -> str:
+    return os.path.join(database_dir, CATALOG_CACHE_SUBDIR, BW_MASK_CACHE_SUBDIR)
+
+
+# Caches binary black ink masks made from the alpha of rgba pngs. Only whether each
+# pixel of the grey mask is at or above 'threshold' is kept, so the antialiased grey
+# values of 'get_bw_image_from_alpha' are lost and this is not a drop-in for it.
+# Each mask is saved as a '.npy' file of packed bits, plus a json file recording the
+# source file stamp. Like the comics catalog, an entry is valid if the source size
+# and mtime are unchanged, or, failing that, if the source content hash is unchanged.
+class BwMaskCache:
+    def __init__(
+        self,
+        cache_dir: str,
+        threshold: int = BW_MASK_THRESHOLD,
+        get_mask: Callable[[str], cv.typing.MatLike] = get_bw_image_from_alpha_in_strips,
+    ):
+        self._cache_dir = cache_dir
+        self._threshold = threshold
+        self._get_mask = get_mask
+
+    def get_cache_dir(self) -> str:
+        return self._cache_dir
+
+    def get_packed_mask(self, rgba_file: str) -> PackedMask:
+        packed_mask = self._load(rgba_file)
+        if packed_mask is not None:
+            return packed_mask
+
+        logging.debug(f'Making bw mask for "{get_relpath(rgba_file)}".')
+        stat = os.stat(rgba_file)
+        packed_mask = PackedMask.from_mask(self._get_mask(rgba_file), self._threshold)
+        entry = BwMaskCacheEntry(
+            BW_MASK_CACHE_FORMAT_VERSION,
+            os.path.abspath(rgba_file),
+            stat.st_size,
+            stat.st_mtime_ns,
+            get_file_sha1(rgba_file),
+            packed_mask.get_shape(),
+            self._threshold,
+        )
+        self._save(entry, packed_mask)
+
+        return packed_mask
+
+    # A 0/255 mask, not the grey values that 'get_bw_image_from_alpha' returns.
+    def get_binary_mask(self, rgba_file: str) -> np.ndarray:
+        return self.get_packed_mask(rgba_file).unpack()
+
+    def remove(self, rgba_file: str) -> None:
+        for file in self._get_cache_files(rgba_file):
+            if os.path.exists(file):
+                os.remove(file)
+
+    def _get_cache_files(self, rgba_file: str) -> Tuple[str, str]:
+        key = hashlib.sha1(os.path.abspath(rgba_file).encode("utf-8")).hexdigest()
+        return (
+            os.path.join(self._cache_dir, key + ".json"),
+            os.path.join(self._cache_dir, key + ".npy"),
+        )
+
+    def _load(self, rgba_file: str) -> Optional[PackedMask]:
+        entry_file, packed_file = self._get_cache_files(rgba_file)
+        if not os.path.isfile(entry_file) or not os.path.isfile(packed_file):
+            return None
+
+        try:
+            with open(entry_file, "r") as f:
+                entry = BwMaskCacheEntry(**json.load(f))
+        except (ValueError, TypeError) as e:
+            logging.warning(f'Could not load bw mask cache entry "{entry_file}": {e}')
+            return None
+
+        if (
+            entry.format_version != BW_MASK_CACHE_FORMAT_VERSION
+            or entry.srce_file != os.path.abspath(rgba_file)
+            or entry.threshold != self._threshold
+        ):
+            return None
+
+        stat = os.stat(rgba_file)
+        if stat.st_size != entry.size:
+            return None
+        if stat.st_mtime_ns != entry.mtime_ns:
+            if get_file_sha1(rgba_file) != entry.sha1:
+                return None
+            entry.mtime_ns = stat.st_mtime_ns
+            _save_entry(entry, entry_file)
+
+        packed = np.load(packed_file, mmap_mode="r")
+        return PackedMask(packed, (entry.shape[0], entry.shape[1]))
+
+    def _save(self, entry: BwMaskCacheEntry, packed_mask: PackedMask) -> None:
+        entry_file, packed_file = self._get_cache_files(entry.srce_file)
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+        # 'np.save' appends '.npy' to names without it, so keep the extension last.
+        temp_packed_file = packed_file[: -len(".npy")] + ".tmp.npy"
+        np.save(temp_packed_file, packed_mask.get_packed())
+        os.replace(temp_packed_file, packed_file)
+
+        _save_entry(entry, entry_file)
+
+
+def _save_entry(entry: BwMaskCacheEntry, entry_file: str) -> None:
+    write_json_file(entry_file, asdict(entry))
@@ -1,8 +1,12 @@
-import logging
+import functools
+import operator
 import os
-from dataclasses import dataclass
+from array import array
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from enum import Flag, auto
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from .comics_consts import (
     PageType,
@@ -29,7 +33,8 @@ from .comics_info import (
     SourceBook,
     get_formatted_day,
 )
-from .comics_utils import get_abbrev_path
+from .resolution_events import ResolutionEvents, ResolutionEventType
+from .volume_manifest import VolumeManifest
 
 INTRO_TITLE_DEFAULT_FONT_SIZE = 155
 INTRO_AUTHOR_DEFAULT_FONT_SIZE = 90
@@ -37,10 +42,121 @@ INTRO_AUTHOR_DEFAULT_FONT_SIZE = 90
 
 @dataclass
 class OriginalPage:
+    __slots__ = ("page_filenames", "page_type")
     page_filenames: str
     page_type: PageType
 
 
+PAGE_TYPES_BY_CODE: Dict[int, PageType] = {page_type.value: page_type for page_type in PageType}
+
+
+def get_page_type_mask(page_types: Iterable[PageType]) -> int:
+    mask = 0
+    for page_type in page_types:
+        mask |= 1 << page_type.value
+    return mask
+
+
+# Compact, array-backed list of pages. Page numbers are stored as ints and page
+# types as 'PageType' codes, so a story does not keep one object alive per page.
+# 'OriginalPage' objects are only created on access.
+class PageTable(Sequence):
+    __slots__ = ("_page_nums", "_page_type_codes", "_page_names")
+
+    def __init__(self, pages: Iterable[OriginalPage] = ()):
+        self._page_nums = array("i")
+        self._page_type_codes = array("B")
+        # Pages with non-numeric names, such as 'title_empty', keyed by index.
+        self._page_names: Dict[int, str] = {}
+        for page in pages:
+            self.append(page.page_filenames, page.page_type)
+
+    def append(self, page_filenames: str, page_type: PageType) -> None:
+        if page_filenames.isdigit() and get_page_str(int(page_filenames)) == page_filenames:
+            self._page_nums.append(int(page_filenames))
+        else:
+            self._page_names[len(self._page_nums)] = page_filenames
+            self._page_nums.append(-1)
+        self._page_type_codes.append(page_type.value)
+
+    def append_range(self, start_num: int, end_num: int, page_type: PageType) -> None:
+        num_pages = end_num - start_num + 1
+        self._page_nums.extend(range(start_num, end_num + 1))
+        self._page_type_codes.extend([page_type.value] * num_pages)
+
+    def get_page_filenames(self, index: int) -> str:
+        page_num = self._page_nums[index]
+        if page_num == -1:
+            return self._page_names[index % len(self._page_nums)]
+        return get_page_str(page_num)
+
+    def get_page_type(self, index: int) -> PageType:
+        return PAGE_TYPES_BY_CODE[self._page_type_codes[index]]
+
+    def get_indices(self, page_type_mask: int) -> List[int]:
+        return [
+            index
+            for index, code in enumerate(self._page_type_codes)
+            if (1 << code) & page_type_mask
+        ]
+
+    def get_pages_of_type(self, page_types: Iterable[PageType]) -> Iterator[OriginalPage]:
+        for index in self.get_indices(get_page_type_mask(page_types)):
+            yield OriginalPage(self.get_page_filenames(index), self.get_page_type(index))
+
+    def __len__(self) -> int:
+        return len(self._page_nums)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return OriginalPage(self.get_page_filenames(index), self.get_page_type(index))
+
+    def __iter__(self) -> Iterator[OriginalPage]:
+        for index in range(len(self._page_nums)):
+            yield OriginalPage(self.get_page_filenames(index), self.get_page_type(index))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PageTable):
+            return (
+                self._page_nums == other._page_nums
+                and self._page_type_codes == other._page_type_codes
+                and self._page_names == other._page_names
+            )
+        return list(self) == other
+
+    def __repr__(self) -> str:
+        return f"PageTable({list(self)!r})"
+
+
+class PageVariant(Flag):
+    SRCE = auto()
+    SRCE_WITH_FIXES = auto()
+    UPSCAYLED = auto()
+    UPSCAYLED_WITH_FIXES = auto()
+    RESTORED = auto()
+    RESTORED_WITH_FIXES = auto()
+    RESTORED_UPSCAYLED = auto()
+    RESTORED_SVG = auto()
+    RESTORED_OCR = auto()
+    PANEL_SEGMENTS = auto()
+    FINAL_SRCE = auto()
+
+
+ALL_PAGE_VARIANTS = functools.reduce(operator.or_, PageVariant)
+
+PageFileGetter = Callable[[str, PageType], Tuple[str, bool]]
+
+
+@dataclass
+class PageVariantFiles:
+    page: OriginalPage
+    files: Dict[PageVariant, str]
+    # None unless the existence of the files was checked.
+    exists: Optional[PageVariant]
+    modified: PageVariant
+
+
 @dataclass
 class RequiredDimensions:
     panels_bbox_width: int = -1
@@ -87,11 +203,20 @@ class ComicBook:
     publication_text: str
     comic_book_info: ComicBookInfo
     config_page_images: List[OriginalPage]
-    page_images_in_order: List[OriginalPage]
+    page_images_in_order: PageTable
+    manifest: Optional[VolumeManifest] = field(default=None, repr=False, compare=False)
+    resolution_events: ResolutionEvents = field(
+        default_factory=ResolutionEvents, repr=False, compare=False
+    )
 
     def __post_init__(self):
         assert self.series_name != ""
         assert self.number_in_series > 0
+        if self.manifest is None:
+            self.manifest = VolumeManifest(self.fanta_info.volume)
+
+    def refresh_manifest(self) -> None:
+        self.manifest.refresh()
 
     def get_srce_image_dir(self) -> str:
         return os.path.join(self.srce_dir, IMAGES_SUBDIR)
@@ -126,88 +251,115 @@ class ComicBook:
     def get_srce_restored_fixes_bounded_dir(self) -> str:
         return os.path.join(self.get_srce_restored_fixes_image_dir(), BOUNDED_SUBDIR)
 
-    def get_srce_upscayled_story_files(self, page_types: List[PageType]) -> List[str]:
-        all_files = []
-        for page in self.page_images_in_order:
-            if page.page_type in page_types:
-                all_files.append(self.get_srce_upscayled_story_file(page.page_filenames))
+    # With the default 'variants', a page that hasn't been restored yet has no FINAL_SRCE
+    # entry in 'files'. Asking for FINAL_SRCE explicitly raises instead. Any other page
+    # resolution error is always raised. Which files exist is only looked up, via
+    # the volume manifest, if 'check_exists' is set.
+    def get_page_variant_files(
+        self,
+        page_types: List[PageType],
+        variants: Optional[PageVariant] = None,
+        check_exists: bool = False,
+    ) -> List[PageVariantFiles]:
+        allow_unresolved = variants is None
+        if variants is None:
+            variants = ALL_PAGE_VARIANTS
+        variant_getters = [
+            (variant, getter)
+            for variant, getter in self._get_page_variant_getters()
+            if variant in variants
+        ]
+
+        all_variant_files = []
+        with self.manifest.batch():
+            for page in self.page_images_in_order.get_pages_of_type(page_types):
+                files = {}
+                exists = PageVariant(0)
+                modified = PageVariant(0)
+                for variant, getter in variant_getters:
+                    if allow_unresolved and variant == PageVariant.FINAL_SRCE:
+                        file, is_modified = self._find_final_srce_story_file(
+                            page.page_filenames, page.page_type
+                        )
+                        if not self.manifest.is_file(file):
+                            continue
+                    else:
+                        file, is_modified = getter(page.page_filenames, page.page_type)
+                    files[variant] = file
+                    if check_exists and self.manifest.is_file(file):
+                        exists |= variant
+                    if is_modified:
+                        modified |= variant
+
+                all_variant_files.append(
+                    PageVariantFiles(page, files, exists if check_exists else None, modified)
+                )
 
-        return all_files
+        return all_variant_files
+
+    def _get_page_variant_getters(self) -> List[Tuple[PageVariant, PageFileGetter]]:
+        unmodified = _get_unmodified_page_file_getter
+
+        return [
+            (PageVariant.SRCE, unmodified(self.get_srce_story_file)),
+            (PageVariant.SRCE_WITH_FIXES, self.get_srce_with_fixes_story_file),
+            (PageVariant.UPSCAYLED, unmodified(self.get_srce_upscayled_story_file)),
+            (PageVariant.UPSCAYLED_WITH_FIXES, self.get_srce_upscayled_with_fixes_story_file),
+            (PageVariant.RESTORED, unmodified(self.get_srce_restored_story_file)),
+            (PageVariant.RESTORED_WITH_FIXES, self.get_srce_restored_with_fixes_file),
+            (
+                PageVariant.RESTORED_UPSCAYLED,
+                unmodified(self.get_srce_restored_upscayled_story_file),
+            ),
+            (PageVariant.RESTORED_SVG, unmodified(self.get_srce_restored_svg_story_file)),
+            (PageVariant.RESTORED_OCR, unmodified(self.get_srce_restored_ocr_story_file)),
+            (PageVariant.PANEL_SEGMENTS, unmodified(self.get_srce_panel_segments_file)),
+            (PageVariant.FINAL_SRCE, self.get_final_srce_story_file),
+        ]
+
+    def _get_variant_files(self, page_types: List[PageType], variant: PageVariant) -> List[str]:
+        return [v.files[variant] for v in self.get_page_variant_files(page_types, variant)]
+
+    def _get_variant_files_and_modified(
+        self, page_types: List[PageType], variant: PageVariant
+    ) -> List[Tuple[str, bool]]:
+        return [
+            (v.files[variant], variant in v.modified)
+            for v in self.get_page_variant_files(page_types, variant)
+        ]
+
+    def get_srce_upscayled_story_files(self, page_types: List[PageType]) -> List[str]:
+        return self._get_variant_files(page_types, PageVariant.UPSCAYLED)
 
     def get_final_srce_upscayled_story_files(
         self, page_types: List[PageType]
     ) -> List[Tuple[str, bool]]:
-        all_files = []
-        for page in self.page_images_in_order:
-            if page.page_type in page_types:
-                file, modified = self.get_srce_upscayled_with_fixes_story_file(
-                    page.page_filenames, page.page_type
-                )
-                all_files.append((file, modified))
-
-        return all_files
+        return self._get_variant_files_and_modified(page_types, PageVariant.UPSCAYLED_WITH_FIXES)
 
-    # TODO: Simplify these duplications
     # TODO: Not needed once everything is restored??????
     def get_srce_restored_story_files(self, page_types: List[PageType]) -> List[str]:
-        all_files = []
-        for page in self.page_images_in_order:
-            if page.page_type in page_types:
-                all_files.append(self.get_srce_restored_story_file(page.page_filenames))
-
-        return all_files
+        return self._get_variant_files(page_types, PageVariant.RESTORED)
 
     def get_srce_restored_upscayled_story_files(self, page_types: List[PageType]) -> List[str]:
-        all_files = []
-        for page in self.page_images_in_order:
-            if page.page_type in page_types:
-                all_files.append(self.get_srce_restored_upscayled_story_file(page.page_filenames))
-
-        return all_files
+        return self._get_variant_files(page_types, PageVariant.RESTORED_UPSCAYLED)
 
     def get_srce_restored_svg_story_files(self, page_types: List[PageType]) -> List[str]:
-        all_files = []
-        for page in self.page_images_in_order:
-            if page.page_type in page_types:
-                all_files.append(self.get_srce_restored_svg_story_file(page.page_filenames))
-
-        return all_files
+        return self._get_variant_files(page_types, PageVariant.RESTORED_SVG)
 
     def get_srce_restored_ocr_story_files(self, page_types: List[PageType]) -> List[str]:
-        all_files = []
-        for page in self.page_images_in_order:
-            if page.page_type in page_types:
-                all_files.append(self.get_srce_restored_ocr_story_file(page.page_filenames))
-
-        return all_files
+        return self._get_variant_files(page_types, PageVariant.RESTORED_OCR)
 
     def get_final_srce_story_files(self, page_types: List[PageType]) -> List[Tuple[str, bool]]:
-        all_files = []
-        for page in self.page_images_in_order:
-            if page.page_type in page_types:
-                file, modified = self.get_final_srce_story_file(page.page_filenames, page.page_type)
-                all_files.append((file, modified))
-
-        return all_files
+        return self._get_variant_files_and_modified(page_types, PageVariant.FINAL_SRCE)
 
     def get_srce_with_fixes_story_files(self, page_types: List[PageType]) -> List[Tuple[str, bool]]:
-        all_files = []
-        for page in self.page_images_in_order:
-            if page.page_type in page_types:
-                file, modified = self.get_srce_with_fixes_story_file(
-                    page.page_filenames, page.page_type
-                )
-                all_files.append((file, modified))
-
-        return all_files
+        return self._get_variant_files_and_modified(page_types, PageVariant.SRCE_WITH_FIXES)
 
     def get_srce_panel_segments_files(self, page_types: List[PageType]) -> List[str]:
-        all_files = []
-        for page in self.page_images_in_order:
-            if page.page_type in page_types:
-                all_files.append(self.get_srce_panel_segments_file(page.page_filenames))
+        return self._get_variant_files(page_types, PageVariant.PANEL_SEGMENTS)
 
-        return all_files
+    def get_srce_story_file(self, page_num: str) -> str:
+        return str(os.path.join(self.get_srce_image_dir(), page_num + JPG_FILE_EXT))
 
     def get_srce_upscayled_story_file(self, page_num: str) -> str:
         return str(os.path.join(self.get_srce_upscayled_image_dir(), page_num + PNG_FILE_EXT))
@@ -238,7 +390,7 @@ class ComicBook:
         srce_upscayled_fixes_file = str(
             os.path.join(self.get_srce_upscayled_fixes_image_dir(), page_num + JPG_FILE_EXT)
         )
-        if os.path.isfile(srce_upscayled_fixes_file):
+        if self.manifest.is_file(srce_upscayled_fixes_file):
             raise Exception(
                 f'Upscayled fixes file must be .png not .jpg: "{srce_upscayled_fixes_file}".'
             )
@@ -246,20 +398,18 @@ class ComicBook:
             os.path.join(self.get_srce_upscayled_fixes_image_dir(), page_num + PNG_FILE_EXT)
         )
 
-        if not os.path.isfile(srce_upscayled_fixes_file):
+        if not self.manifest.is_file(srce_upscayled_fixes_file):
             return srce_upscayled_file, False
 
-        if os.path.isfile(srce_upscayled_file):
-            logging.info(
-                f"NOTE: Using upscayled fixes srce file:"
-                f' "{get_abbrev_path(srce_upscayled_fixes_file)}".'
+        if self.manifest.is_file(srce_upscayled_file):
+            self.resolution_events.record(
+                ResolutionEventType.UPSCAYLED_FIXES, page_num, page_type, srce_upscayled_fixes_file
             )
             if page_type not in [PageType.COVER, PageType.BODY]:
                 raise Exception(f"Expected upscayled fixes page to be COVER or BODY: '{page_num}'.")
         else:
-            logging.info(
-                f"NOTE: Using added srce upscayled file of type {page_type.name}:"
-                f' "{get_abbrev_path(srce_upscayled_fixes_file)}".'
+            self.resolution_events.record(
+                ResolutionEventType.ADDED_UPSCAYLED, page_num, page_type, srce_upscayled_fixes_file
             )
             if page_type in [PageType.COVER, PageType.BODY]:
                 raise Exception(f"Expected added page to be NOT COVER OR BODY: '{page_num}'.")
@@ -269,6 +419,14 @@ class ComicBook:
         return srce_upscayled_fixes_file, is_modified_file
 
     def get_final_srce_story_file(self, page_num: str, page_type: PageType) -> Tuple[str, bool]:
+        srce_file, is_modified = self._find_final_srce_story_file(page_num, page_type)
+        if not self.manifest.is_file(srce_file):
+            raise Exception(f'Could not find restored source file "{srce_file}".')
+
+        return srce_file, is_modified
+
+    # Falls back to the restored file, which may not exist yet.
+    def _find_final_srce_story_file(self, page_num: str, page_type: PageType) -> Tuple[str, bool]:
         if page_type in [
             PageType.FRONT,
             PageType.COVER,
@@ -276,47 +434,39 @@ class ComicBook:
             PageType.BACK_NO_PANELS,
         ]:
             srce_file, is_modified = self.get_srce_with_fixes_story_file(page_num, page_type)
-            print(srce_file)
-            if os.path.isfile(srce_file):
+            if self.manifest.is_file(srce_file):
                 return srce_file, is_modified
 
-        srce_restored_file, is_modified = self.get_srce_restored_with_fixes_file(
-            page_num, page_type
-        )
-        if os.path.isfile(srce_restored_file):
-            return srce_restored_file, is_modified
-
-        raise Exception(f'Could not find restored source file "{srce_restored_file}".')
+        return self.get_srce_restored_with_fixes_file(page_num, page_type)
 
     def get_srce_with_fixes_story_file(
         self, page_num: str, page_type: PageType
     ) -> Tuple[str, bool]:
-        srce_file = str(os.path.join(self.get_srce_image_dir(), page_num + JPG_FILE_EXT))
+        srce_file = self.get_srce_story_file(page_num)
         srce_fixes_file = str(
             os.path.join(self.get_srce_fixes_image_dir(), page_num + JPG_FILE_EXT)
         )
-        if not os.path.isfile(srce_fixes_file):
+        if not self.manifest.is_file(srce_fixes_file):
             return srce_file, False
 
-        if os.path.isfile(srce_file):
+        if self.manifest.is_file(srce_file):
             if self._is_fixes_special_case(page_num, page_type):
-                logging.info(
-                    f"NOTE: Special case - using {page_type.name} fixes srce file:"
-                    f' "{get_abbrev_path(srce_fixes_file)}".'
+                self.resolution_events.record(
+                    ResolutionEventType.SPECIAL_CASE_FIXES, page_num, page_type, srce_fixes_file
                 )
             else:
-                logging.info(f'NOTE: Using fixes srce file: "{get_abbrev_path(srce_fixes_file)}".')
+                self.resolution_events.record(
+                    ResolutionEventType.FIXES, page_num, page_type, srce_fixes_file
+                )
                 if page_type not in [PageType.COVER, PageType.BODY]:
                     raise Exception(f"Expected fixes page to be COVER or BODY: '{page_num}'.")
         elif self._is_fixes_special_case(page_num, page_type):
-            logging.info(
-                f"NOTE: Special case - using ADDED fixes srce file for {page_type.name} page:"
-                f' "{get_abbrev_path(srce_fixes_file)}".'
+            self.resolution_events.record(
+                ResolutionEventType.SPECIAL_CASE_ADDED_FIXES, page_num, page_type, srce_fixes_file
             )
         else:
-            logging.info(
-                f"NOTE: Using added srce file of type {page_type.name}:"
-                f' "{get_abbrev_path(srce_fixes_file)}".'
+            self.resolution_events.record(
+                ResolutionEventType.ADDED, page_num, page_type, srce_fixes_file
             )
             if page_type in [PageType.COVER, PageType.BODY]:
                 raise Exception(f"Expected added page to be NOT COVER OR BODY: '{page_num}'.")
@@ -331,12 +481,12 @@ class ComicBook:
         srce_restored_file = str(
             os.path.join(self.get_srce_restored_image_dir(), page_num + JPG_FILE_EXT)
         )
-        if os.path.isfile(srce_restored_file):
+        if self.manifest.is_file(srce_restored_file):
             raise Exception(f'Restored files should be png not jpg: "{srce_restored_file}".')
         srce_restored_fixes_file = str(
             os.path.join(self.get_srce_restored_fixes_image_dir(), page_num + JPG_FILE_EXT)
         )
-        if os.path.isfile(srce_restored_fixes_file):
+        if self.manifest.is_file(srce_restored_fixes_file):
             raise Exception(
                 f'Restored fixes files should be png not jpg: "{srce_restored_fixes_file}".'
             )
@@ -348,33 +498,38 @@ class ComicBook:
             os.path.join(self.get_srce_restored_fixes_image_dir(), page_num + PNG_FILE_EXT)
         )
 
-        if not os.path.isfile(srce_restored_fixes_file):
+        if not self.manifest.is_file(srce_restored_fixes_file):
             return srce_restored_file, False
 
-        if os.path.isfile(srce_restored_file):
+        if self.manifest.is_file(srce_restored_file):
             if self._is_fixes_special_case(page_num, page_type):
-                logging.info(
-                    f"NOTE: Special case - using {page_type.name} restored fixes srce file:"
-                    f' "{get_abbrev_path(srce_restored_fixes_file)}".'
+                self.resolution_events.record(
+                    ResolutionEventType.SPECIAL_CASE_RESTORED_FIXES,
+                    page_num,
+                    page_type,
+                    srce_restored_fixes_file,
                 )
             else:
-                logging.info(
-                    f"NOTE: Using restored fixes srce file:"
-                    f' "{get_abbrev_path(srce_restored_fixes_file)}".'
+                self.resolution_events.record(
+                    ResolutionEventType.RESTORED_FIXES,
+                    page_num,
+                    page_type,
+                    srce_restored_fixes_file,
                 )
                 if page_type not in [PageType.COVER, PageType.BODY]:
                     raise Exception(
                         f"Expected restored fixes page to be COVER or BODY:" f' "{page_num}".'
                     )
         elif self._is_fixes_special_case(page_num, page_type):
-            logging.info(
-                f"NOTE: Special case - using ADDED restored fixes srce file for"
-                f' {page_type.name} page: "{get_abbrev_path(srce_restored_fixes_file)}".'
+            self.resolution_events.record(
+                ResolutionEventType.SPECIAL_CASE_ADDED_RESTORED_FIXES,
+                page_num,
+                page_type,
+                srce_restored_fixes_file,
             )
         else:
-            logging.info(
-                f"NOTE: Using added srce restored file of type {page_type.name}:"
-                f' "{get_abbrev_path(srce_restored_fixes_file)}".'
+            self.resolution_events.record(
+                ResolutionEventType.ADDED_RESTORED, page_num, page_type, srce_restored_fixes_file
             )
             if page_type in [PageType.COVER, PageType.BODY]:
                 raise Exception(f"Expected added page to be NOT COVER OR BODY: '{page_num}'.")
@@ -401,8 +556,8 @@ class ComicBook:
             self.get_srce_restored_fixes_bounded_dir(), get_page_str(page_num) + PNG_FILE_EXT
         )
 
-        if os.path.isfile(panels_bounds_file):
-            if os.path.isfile(panels_bounds_restored_file):
+        if self.manifest.is_file(panels_bounds_file):
+            if self.manifest.is_file(panels_bounds_restored_file):
                 raise Exception(
                     f"Cannot have fixes and restored fixes bounds files: "
                     f'"{panels_bounds_file}" and'
@@ -410,7 +565,7 @@ class ComicBook:
                 )
             return panels_bounds_file
 
-        if os.path.isfile(panels_bounds_restored_file):
+        if self.manifest.is_file(panels_bounds_restored_file):
             return panels_bounds_restored_file
 
         return ""
@@ -497,6 +652,10 @@ class ComicBook:
         return f"{self.get_dest_rel_dirname()} [{self.get_comic_issue_title()}]"
 
 
+def _get_unmodified_page_file_getter(get_file: Callable[[str], str]) -> PageFileGetter:
+    return lambda page_num, _page_type: (get_file(page_num), False)
+
+
 def get_lookup_title(title: str, file_title: str) -> str:
     if title != "":
         return get_safe_title(title)
@@ -540,18 +699,14 @@ def get_main_publication_info(
     return publication_text
 
 
-def _get_pages_in_order(config_pages: List[OriginalPage]) -> List[OriginalPage]:
-    page_images = []
+def _get_pages_in_order(config_pages: List[OriginalPage]) -> PageTable:
+    page_images = PageTable()
     for config_page in config_pages:
         if "-" not in config_page.page_filenames:
-            page_images.append(config_page)
+            page_images.append(config_page.page_filenames, config_page.page_type)
         else:
             start, end = config_page.page_filenames.split("-")
-            start_num = int(start)
-            end_num = int(end)
-            for file_num in range(start_num, end_num + 1):
-                filename = get_page_str(file_num)
-                page_images.append(OriginalPage(filename, config_page.page_type))
+            page_images.append_range(int(start), int(end), config_page.page_type)
 
     return page_images
 
@@ -602,9 +757,8 @@ def get_story_files_of_page_type(
 ) -> List[str]:
     srce_pages = comic.page_images_in_order
     all_files = []
-    for page in srce_pages:
-        if page.page_type in page_types:
-            all_files.append(os.path.join(image_dir, page.page_filenames + file_ext))
+    for page in srce_pages.get_pages_of_type(page_types):
+        all_files.append(os.path.join(image_dir, page.page_filenames + file_ext))
 
     return all_files
 
@@ -628,8 +782,7 @@ def get_jpg_page_list(comic: ComicBook) -> List[str]:
 
 def get_jpg_page_of_type_list(comic: ComicBook, page_types: List[PageType]) -> List[str]:
     all_pages = []
-    for page in comic.page_images_in_order:
-        if page.page_type in page_types:
-            all_pages.append(page.page_filenames)
+    for page in comic.page_images_in_order.get_pages_of_type(page_types):
+        all_pages.append(page.page_filenames)
 
     return all_pages
@@ -0,0 +1,87 @@
+import collections
+import os
+from dataclasses import dataclass, replace
+from typing import Optional, OrderedDict, Tuple
+
+from .comic_book import ComicBook
+from .resolution_events import ResolutionEvents
+
+DEFAULT_COMIC_BOOK_CACHE_SIZE = 128
+
+ComicBookStamp = Tuple[int, int]
+
+
+@dataclass
+class ComicBookCacheInfo:
+    hits: int
+    misses: int
+    max_size: int
+    curr_size: int
+
+
+# LRU cache of constructed comic books keyed by story title. An entry is only
+# returned while its INI file and intro inset file are unchanged on disk. The cache
+# keeps its own copy of each comic book and 'get' returns a new copy every time, so
+# callers are free to change the comic books they get.
+class ComicBookCache:
+    def __init__(self, max_size: int = DEFAULT_COMIC_BOOK_CACHE_SIZE):
+        self._max_size = max_size
+        self._comics: OrderedDict[str, Tuple[ComicBook, ComicBookStamp]] = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, story_title: str, ini_file: str) -> Optional[ComicBook]:
+        if story_title not in self._comics:
+            self._misses += 1
+            return None
+
+        comic, stamp = self._comics[story_title]
+        if stamp != _get_stamp(ini_file, comic.intro_inset_file):
+            del self._comics[story_title]
+            self._misses += 1
+            return None
+
+        self._comics.move_to_end(story_title)
+        self._hits += 1
+
+        return _get_comic_book_copy(comic)
+
+    def put(self, story_title: str, comic: ComicBook) -> None:
+        if self._max_size <= 0:
+            return
+
+        self._comics[story_title] = (
+            _get_comic_book_copy(comic),
+            _get_stamp(comic.ini_file, comic.intro_inset_file),
+        )
+        self._comics.move_to_end(story_title)
+
+        while len(self._comics) > self._max_size:
+            self._comics.popitem(last=False)
+
+    def clear(self) -> None:
+        self._comics.clear()
+        self._hits = 0
+        self._misses = 0
+
+    def get_info(self) -> ComicBookCacheInfo:
+        return ComicBookCacheInfo(self._hits, self._misses, self._max_size, len(self._comics))
+
+
+# A shallow copy, apart from the fields that are filled in or added to after the comic
+# book is made. Each copy starts with no resolution events.
+def _get_comic_book_copy(comic: ComicBook) -> ComicBook:
+    return replace(
+        comic, required_dim=replace(comic.required_dim), resolution_events=ResolutionEvents()
+    )
+
+
+def _get_stamp(ini_file: str, inset_file: str) -> ComicBookStamp:
+    return _get_mtime_ns(ini_file), _get_mtime_ns(inset_file)
+
+
+def _get_mtime_ns(file: str) -> int:
+    try:
+        return os.stat(file).st_mtime_ns
+    except FileNotFoundError:
+        return -1
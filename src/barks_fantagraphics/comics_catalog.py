@@ -0,0 +1,199 @@
+import configparser
+import logging
+import os
+import pickle
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import comics_info
+from .comics_consts import (
+    CATALOG_CACHE_SUBDIR,
+    CATALOG_FILENAME,
+    PUBLICATION_INFO_SUBDIR,
+    STORIES_INFO_FILENAME,
+)
+from .comics_info import ComicBookInfoDict, get_all_comic_book_info
+from .comics_utils import get_file_sha1, get_relpath
+
+# Bump this whenever the layout of 'ComicsCatalog' changes.
+CATALOG_FORMAT_VERSION = 2
+
+IniContents = Dict[str, Dict[str, str]]
+
+
+@dataclass
+class SourceStamp:
+    mtime_ns: int
+    size: int
+    sha1: str
+
+
+@dataclass
+class ComicsCatalog:
+    format_version: int
+    source_stamps: Dict[str, SourceStamp]
+    all_comic_book_info: ComicBookInfoDict
+    ini_contents: Dict[str, IniContents]
+    issue_titles: Dict[str, List[str]]
+    source_comic_titles: Dict[str, List[str]]
+
+
+def get_catalog_file(database_dir: str) -> str:
+    return os.path.join(database_dir, CATALOG_CACHE_SUBDIR, CATALOG_FILENAME)
+
+
+def get_comics_catalog(database_dir: str, story_titles_dir: str) -> ComicsCatalog:
+    catalog_file = get_catalog_file(database_dir)
+    source_files = _get_source_files(database_dir, story_titles_dir)
+
+    catalog = _load_catalog(catalog_file)
+    if catalog is not None:
+        is_valid, stamps_changed = _is_valid_catalog(catalog, source_files)
+        if is_valid:
+            if stamps_changed:
+                _save_catalog(catalog, catalog_file)
+            return catalog
+
+    logging.debug(f'Building comics catalog "{get_relpath(catalog_file)}".')
+    catalog = _build_catalog(database_dir, source_files)
+    _save_catalog(catalog, catalog_file)
+
+    return catalog
+
+
+# The catalog's parsed (uninterpolated) contents of an INI file, or None if the file has
+# changed since the catalog was built.
+def get_catalog_ini_contents(catalog: ComicsCatalog, ini_file: str) -> Optional[IniContents]:
+    stamp = catalog.source_stamps.get(ini_file)
+    if stamp is None:
+        return None
+    try:
+        stat = os.stat(ini_file)
+    except FileNotFoundError:
+        return None
+    if stat.st_mtime_ns != stamp.mtime_ns or stat.st_size != stamp.size:
+        return None
+
+    return catalog.ini_contents.get(Path(ini_file).stem)
+
+
+def _get_source_files(database_dir: str, story_titles_dir: str) -> List[str]:
+    stories_file = os.path.join(database_dir, PUBLICATION_INFO_SUBDIR, STORIES_INFO_FILENAME)
+
+    # 'SERIES_INFO' and 'SOURCE_COMICS' live in code, so the catalog depends on it as well.
+    source_files = [stories_file, os.path.realpath(comics_info.__file__)]
+    source_files.extend(
+        sorted(
+            os.path.join(story_titles_dir, f)
+            for f in os.listdir(story_titles_dir)
+            if f.endswith(".ini")
+        )
+    )
+
+    return source_files
+
+
+def _build_catalog(database_dir: str, source_files: List[str]) -> ComicsCatalog:
+    all_comic_book_info = get_all_comic_book_info(database_dir)
+
+    ini_contents = {}
+    for file in source_files:
+        if file.endswith(".ini"):
+            ini_contents[Path(file).stem] = _get_ini_contents(file)
+
+    return ComicsCatalog(
+        format_version=CATALOG_FORMAT_VERSION,
+        source_stamps={file: _get_source_stamp(file) for file in source_files},
+        all_comic_book_info=all_comic_book_info,
+        ini_contents=ini_contents,
+        issue_titles=_get_all_issue_titles(all_comic_book_info),
+        source_comic_titles=_get_all_source_comic_titles(ini_contents),
+    )
+
+
+def _get_ini_contents(ini_file: str) -> IniContents:
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(ini_file)
+
+    return {section: dict(config[section]) for section in config.sections()}
+
+
+def _get_all_issue_titles(all_comic_book_info: ComicBookInfoDict) -> Dict[str, List[str]]:
+    all_issues = {}
+    for title in all_comic_book_info:
+        issue_title = all_comic_book_info[title].get_issue_title()
+        if issue_title not in all_issues:
+            all_issues[issue_title] = [title]
+        else:
+            all_issues[issue_title].append(title)
+
+    return all_issues
+
+
+def _get_all_source_comic_titles(ini_contents: Dict[str, IniContents]) -> Dict[str, List[str]]:
+    all_source_comics = {}
+    for story_title in sorted(ini_contents):
+        source_comic = ini_contents[story_title]["info"]["source_comic"]
+        if source_comic not in all_source_comics:
+            all_source_comics[source_comic] = [story_title]
+        else:
+            all_source_comics[source_comic].append(story_title)
+
+    return all_source_comics
+
+
+def _get_source_stamp(file: str) -> SourceStamp:
+    stat = os.stat(file)
+    return SourceStamp(stat.st_mtime_ns, stat.st_size, get_file_sha1(file))
+
+
+def _is_valid_catalog(catalog: ComicsCatalog, source_files: List[str]) -> Tuple[bool, bool]:
+    if catalog.format_version != CATALOG_FORMAT_VERSION:
+        return False, False
+    if set(catalog.source_stamps) != set(source_files):
+        return False, False
+
+    # Cheap mtime and size check first. Only fall back to hashing the contents when
+    # these differ, so that a touched or re-checked-out file does not force a rebuild.
+    stamps_changed = False
+    for file in source_files:
+        stamp = catalog.source_stamps[file]
+        stat = os.stat(file)
+        if stat.st_mtime_ns == stamp.mtime_ns and stat.st_size == stamp.size:
+            continue
+        if stat.st_size != stamp.size or get_file_sha1(file) != stamp.sha1:
+            logging.debug(f'Comics catalog is out of date: "{get_relpath(file)}" has changed.')
+            return False, False
+        stamp.mtime_ns = stat.st_mtime_ns
+        stamps_changed = True
+
+    return True, stamps_changed
+
+
+def _load_catalog(catalog_file: str) -> Optional[ComicsCatalog]:
+    if not os.path.isfile(catalog_file):
+        return None
+
+    try:
+        with open(catalog_file, "rb") as f:
+            catalog = pickle.load(f)
+    except Exception as e:
+        logging.warning(f'Could not load comics catalog "{catalog_file}": {e}')
+        return None
+
+    if not isinstance(catalog, ComicsCatalog):
+        return None
+
+    return catalog
+
+
+def _save_catalog(catalog: ComicsCatalog, catalog_file: str) -> None:
+    temp_file = catalog_file + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(catalog_file), exist_ok=True)
+        with open(temp_file, "wb") as f:
+            pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, catalog_file)
+    except OSError as e:
+        logging.warning(f'Could not save comics catalog "{catalog_file}": {e}')
@@ -18,9 +18,13 @@ BOUNDED_SUBDIR = "bounded"
 PUBLICATION_INFO_SUBDIR = "story-indexes"
 SUBMISSION_DATES_SUBDIR = "story-indexes"
 STORIES_INFO_FILENAME = "the-stories.csv"
+CATALOG_CACHE_SUBDIR = ".cache"
+CATALOG_FILENAME = "comics-catalog.pickle"
 
 INSET_FILE_EXT = ".png"
 
+METADATA_PROPERTY_GROUP = "BARKS"
+
 
 class PageType(Enum):
     FRONT = 1
@@ -1,10 +1,9 @@
 import configparser
-import difflib
 import logging
 import os
-from configparser import ConfigParser, ExtendedInterpolation
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from .comic_book import (
     ComicBook,
@@ -19,6 +18,8 @@ from .comic_book import (
     get_main_publication_info,
     _get_pages_in_order,
 )
+from .comic_book_cache import ComicBookCache, ComicBookCacheInfo, DEFAULT_COMIC_BOOK_CACHE_SIZE
+from .comics_catalog import get_catalog_ini_contents, get_comics_catalog
 from .comics_consts import (
     PageType,
     get_font_path,
@@ -40,9 +41,12 @@ from .comics_info import (
     FANTAGRAPHICS_RESTORED_FIXES_DIRNAME,
     FANTAGRAPHICS_PANEL_SEGMENTS_DIRNAME,
     FANTAGRAPHICS_RESTORED_OCR_DIRNAME,
-    get_all_comic_book_info,
 )
 from .comics_utils import get_relpath
+from .title_search_index import TitleSearchIndex
+from .volume_manifest import VolumeManifest
+
+DIR_CHECK_MAX_WORKERS = 16
 
 
 def get_default_comics_database_dir() -> str:
@@ -50,24 +54,21 @@ def get_default_comics_database_dir() -> str:
 
 
 class ComicsDatabase:
-    def __init__(self, database_dir: str):
+    def __init__(
+        self, database_dir: str, comic_book_cache_size: int = DEFAULT_COMIC_BOOK_CACHE_SIZE
+    ):
         self._database_dir = _get_comics_database_dir(database_dir)
         self._story_titles_dir = _get_story_titles_dir(self._database_dir)
-        self._all_comic_book_info = get_all_comic_book_info(self._database_dir)
-        self._ini_files = [f for f in os.listdir(self._story_titles_dir) if f.endswith(".ini")]
-        self._story_titles = set([Path(f).stem for f in self._ini_files])
-        self._issue_titles = self._get_all_issue_titles()
-
-    def _get_all_issue_titles(self):
-        all_issues = {}
-        for title in self._all_comic_book_info:
-            issue_title = self._all_comic_book_info[title].get_issue_title()
-            if issue_title not in all_issues:
-                all_issues[issue_title] = [title]
-            else:
-                all_issues[issue_title].append(title)
-
-        return all_issues
+        self._catalog = get_comics_catalog(self._database_dir, self._story_titles_dir)
+        self._all_comic_book_info = self._catalog.all_comic_book_info
+        self._story_titles = set(self._catalog.ini_contents)
+        self._issue_titles = self._catalog.issue_titles
+        self._source_comic_titles = self._catalog.source_comic_titles
+        # The title indexes are only built when first needed.
+        self._story_title_index: Optional[TitleSearchIndex] = None
+        self._issue_title_index: Optional[TitleSearchIndex] = None
+        self._comic_book_cache = ComicBookCache(comic_book_cache_size)
+        self._volume_manifests: Dict[int, VolumeManifest] = {}
 
     def get_comics_database_dir(self) -> str:
         return self._database_dir
@@ -82,7 +83,7 @@ class ComicsDatabase:
         if title in self._story_titles:
             return True, ""
 
-        close = difflib.get_close_matches(title, self._story_titles, 1, 0.3)
+        close = self._get_story_title_index().get_close_matches(title, 1, 0.3)
         close_str = close[0] if close else ""
         return False, close_str
 
@@ -91,24 +92,34 @@ class ComicsDatabase:
         if issue_title in self._issue_titles:
             return True, self._issue_titles[issue_title], ""
 
-        close = difflib.get_close_matches(issue_title, self._issue_titles, 1, 0.7)
+        close = self._get_issue_title_index().get_close_matches(issue_title, 1, 0.7)
         close_str = close[0] if close else ""
         return False, [], close_str
 
+    def get_story_title_completions(self, prefix: str, max_completions: int = 10) -> List[str]:
+        return self._get_story_title_index().get_completions(prefix, max_completions)
+
+    def get_issue_title_completions(self, prefix: str, max_completions: int = 10) -> List[str]:
+        return self._get_issue_title_index().get_completions(prefix.upper(), max_completions)
+
+    def _get_story_title_index(self) -> TitleSearchIndex:
+        if self._story_title_index is None:
+            self._story_title_index = TitleSearchIndex(self._story_titles)
+        return self._story_title_index
+
+    def _get_issue_title_index(self) -> TitleSearchIndex:
+        if self._issue_title_index is None:
+            self._issue_title_index = TitleSearchIndex(self._issue_titles)
+        return self._issue_title_index
+
     def get_all_story_titles(self) -> List[str]:
         return sorted(self._story_titles)
 
     def get_all_story_titles_in_fantagraphics_volume(self, volume_nums: List[int]) -> List[str]:
-        config = ConfigParser(interpolation=ExtendedInterpolation())
         story_titles = []
         for volume_num in volume_nums:
             fanta_key = f"FANTA_{volume_num:02}"
-            for file in self._ini_files:
-                ini_file = os.path.join(self._story_titles_dir, file)
-                config.read(ini_file)
-                if config["info"]["source_comic"] == fanta_key:
-                    story_title = Path(ini_file).stem
-                    story_titles.append(story_title)
+            story_titles.extend(self._source_comic_titles.get(fanta_key, []))
 
         return sorted(story_titles)
 
@@ -286,7 +297,41 @@ class ComicsDatabase:
             os.makedirs(vol_dirname)
             logging.info(f'Created dir "{vol_dirname}".')
 
-    def get_comic_book(self, title: str, allow_issue_titles: bool = True) -> ComicBook:
+    def get_volume_manifest(self, volume_num: int) -> VolumeManifest:
+        if volume_num not in self._volume_manifests:
+            self._volume_manifests[volume_num] = VolumeManifest(volume_num)
+        return self._volume_manifests[volume_num]
+
+    def refresh_volume_manifests(self) -> None:
+        for manifest in self._volume_manifests.values():
+            manifest.refresh()
+
+    def get_comic_book_cache_info(self) -> ComicBookCacheInfo:
+        return self._comic_book_cache.get_info()
+
+    def clear_comic_book_cache(self) -> None:
+        self._comic_book_cache.clear()
+
+    def get_comic_book(
+        self, title: str, allow_issue_titles: bool = True, use_cache: bool = True
+    ) -> ComicBook:
+        story_title = self._get_story_title(title, allow_issue_titles)
+        ini_file = self.get_ini_file(story_title)
+
+        if use_cache:
+            comic = self._comic_book_cache.get(story_title, ini_file)
+            if comic is not None:
+                return comic
+
+        comic = self._make_comic_book(ini_file)
+        self._check_comic_book_dirs(comic)
+
+        if use_cache:
+            self._comic_book_cache.put(story_title, comic)
+
+        return comic
+
+    def _get_story_title(self, title: str, allow_issue_titles: bool) -> str:
         story_title = ""
         if allow_issue_titles:
             found, titles, close = self.get_story_title_from_issue(title)
@@ -308,11 +353,18 @@ class ComicsDatabase:
                     raise Exception(f'Could not find title "{title}". Did you mean "{close}"?')
                 raise Exception(f'Could not find title "{title}".')
 
-        ini_file = self.get_ini_file(story_title)
+        return story_title
+
+    def _make_comic_book(self, ini_file: str) -> ComicBook:
         logging.debug(f'Getting comic book info from config file "{get_relpath(ini_file)}".')
 
+        # The catalog already holds the parsed INI - it is only read again if it has changed.
         config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
-        config.read(ini_file)
+        ini_contents = get_catalog_ini_contents(self._catalog, ini_file)
+        if ini_contents is None:
+            config.read(ini_file)
+        else:
+            config.read_dict(ini_contents)
 
         title = config["info"]["title"]
         issue_title = "" if "issue_title" not in config["info"] else config["info"]["issue_title"]
@@ -393,46 +445,91 @@ class ComicsDatabase:
             comic_book_info=cb_info,
             config_page_images=config_page_images,
             page_images_in_order=_get_pages_in_order(config_page_images),
+            manifest=self.get_volume_manifest(fanta_info.volume),
         )
 
-        if not os.path.isdir(comic.srce_dir):
-            raise Exception(f'Could not find srce directory "{comic.srce_dir}".')
-        if not os.path.isdir(comic.get_srce_image_dir()):
-            raise Exception(f'Could not find srce image directory "{comic.get_srce_image_dir()}".')
-        if not os.path.isdir(comic.srce_upscayled_dir):
-            raise Exception(
-                f'Could not find srce upscayled directory "{comic.srce_upscayled_dir}".'
-            )
-        if not os.path.isdir(comic.get_srce_upscayled_image_dir()):
-            raise Exception(
-                f"Could not find srce upscayled image directory"
-                f' "{comic.get_srce_upscayled_image_dir()}".'
-            )
-        if not os.path.isdir(comic.srce_restored_dir):
-            raise Exception(f'Could not find srce restored directory "{comic.srce_restored_dir}".')
-        if not os.path.isdir(comic.get_srce_restored_image_dir()):
-            raise Exception(
-                f"Could not find srce restored image directory"
-                f' "{comic.get_srce_restored_image_dir()}".'
-            )
-        if not os.path.isdir(comic.srce_fixes_dir):
-            raise Exception(f'Could not find srce fixes directory "{comic.srce_fixes_dir}".')
-        if not os.path.isdir(comic.get_srce_fixes_image_dir()):
-            raise Exception(
-                f'Could not find srce fixes image directory "{comic.get_srce_fixes_image_dir()}".'
-            )
-        if not os.path.isdir(comic.srce_restored_fixes_dir):
-            raise Exception(
-                f'Could not find srce restored fixes directory "{comic.srce_restored_fixes_dir}".'
-            )
-        if not os.path.isdir(comic.get_srce_restored_fixes_image_dir()):
-            raise Exception(
-                f"Could not find srce restored fixes image directory"
-                f' "{comic.get_srce_fixes_image_dir()}".'
-            )
-
         return comic
 
+    @staticmethod
+    def _check_comic_book_dirs(comic: ComicBook) -> None:
+        for dir_desc, required_dir in _get_required_dirs(comic):
+            if not os.path.isdir(required_dir):
+                raise Exception(f'Could not find {dir_desc} "{required_dir}".')
+
+    def get_comic_books(
+        self,
+        titles: List[str],
+        allow_issue_titles: bool = True,
+        use_cache: bool = True,
+        max_workers: int = DIR_CHECK_MAX_WORKERS,
+    ) -> List[ComicBook]:
+        errors = []
+        story_titles = []
+        comics: Dict[str, ComicBook] = {}
+        unchecked_comics: Dict[str, ComicBook] = {}
+        for title in titles:
+            try:
+                story_title = self._get_story_title(title, allow_issue_titles)
+                story_titles.append(story_title)
+                if story_title in comics or story_title in unchecked_comics:
+                    continue
+
+                ini_file = self.get_ini_file(story_title)
+                comic = self._comic_book_cache.get(story_title, ini_file) if use_cache else None
+                if comic is not None:
+                    comics[story_title] = comic
+                else:
+                    unchecked_comics[story_title] = self._make_comic_book(ini_file)
+            except Exception as e:
+                errors.append(f'"{title}": {e}')
+
+        # All the stories in a volume share the same directories, so each distinct
+        # directory only needs to be checked once.
+        required_dirs = sorted(
+            set(
+                required_dir
+                for comic in unchecked_comics.values()
+                for _, required_dir in _get_required_dirs(comic)
+            )
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            dir_exists = dict(zip(required_dirs, executor.map(os.path.isdir, required_dirs)))
+
+        for story_title, comic in unchecked_comics.items():
+            missing_dirs = [
+                f'Could not find {dir_desc} "{required_dir}".'
+                for dir_desc, required_dir in _get_required_dirs(comic)
+                if not dir_exists[required_dir]
+            ]
+            if missing_dirs:
+                errors.append(f'"{story_title}": {" ".join(missing_dirs)}')
+                continue
+
+            comics[story_title] = comic
+            if use_cache:
+                self._comic_book_cache.put(story_title, comic)
+
+        if errors:
+            errors_str = "\n".join(errors)
+            raise Exception(f"Could not get {len(errors)} of the comic books:\n{errors_str}")
+
+        return [comics[story_title] for story_title in story_titles]
+
+
+def _get_required_dirs(comic: ComicBook) -> List[Tuple[str, str]]:
+    return [
+        ("srce directory", comic.srce_dir),
+        ("srce image directory", comic.get_srce_image_dir()),
+        ("srce upscayled directory", comic.srce_upscayled_dir),
+        ("srce upscayled image directory", comic.get_srce_upscayled_image_dir()),
+        ("srce restored directory", comic.srce_restored_dir),
+        ("srce restored image directory", comic.get_srce_restored_image_dir()),
+        ("srce fixes directory", comic.srce_fixes_dir),
+        ("srce fixes image directory", comic.get_srce_fixes_image_dir()),
+        ("srce restored fixes directory", comic.srce_restored_fixes_dir),
+        ("srce restored fixes image directory", comic.get_srce_restored_fixes_image_dir()),
+    ]
+
 
 def _get_comics_database_dir(db_dir: str) -> str:
     real_db_dir = os.path.realpath(db_dir)
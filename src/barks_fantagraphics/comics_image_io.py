@@ -1,23 +1,43 @@
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 import cv2 as cv
 import numpy as np
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 
+from .comics_consts import METADATA_PROPERTY_GROUP
+from .jpg_segments import (
+    get_jpg_comment_text,
+    read_jpg_comment_segments,
+    write_jpg_comment_segments,
+)
+from .png_chunks import (
+    PNG_COLOR_TYPE_RGBA,
+    PngHeader,
+    get_png_header,
+    iter_png_filtered_rows,
+    make_png,
+    write_png_text_chunks,
+)
+from .png_encoder import write_png_parallel
+
 Image.MAX_IMAGE_PIXELS = None
 
 SAVE_PNG_COMPRESSION = 9
 SAVE_JPG_QUALITY = 95
 SAVE_JPG_COMPRESS_LEVEL = 9
 
-METADATA_PROPERTY_GROUP = "BARKS"
+BW_IMAGE_SCALE = 4
+# Must be a multiple of BW_IMAGE_SCALE so each strip downsamples independently.
+ALPHA_STRIP_HEIGHT = 256
+BW_IMAGE_MAX_WORKERS = 4
 
 
 def get_bw_image_from_alpha(rgba_file: str) -> cv.typing.MatLike:
     black_mask = cv.imread(rgba_file, -1)
 
-    scale = 4
+    scale = BW_IMAGE_SCALE
     black_mask = cv.resize(
         black_mask, (0, 0), fx=1.0 / scale, fy=1.0 / scale, interpolation=cv.INTER_AREA
     )
@@ -28,23 +48,101 @@ def get_bw_image_from_alpha(rgba_file: str) -> cv.typing.MatLike:
     return binary
 
 
-def add_jpg_metadata(jpg_file: str, metadata: Dict[str, str]):
-    pil_image = Image.open(jpg_file, "r")
-
-    jpg_metadata = PngInfo()
-    for key in metadata:
-        jpg_metadata.add_text(f"{METADATA_PROPERTY_GROUP}:{key}", metadata[key])
-
-    pil_image.save(
-        jpg_file,
-        jpginfo=jpg_metadata,
-        optimize=True,
-        compress_level=SAVE_JPG_COMPRESS_LEVEL,
-        quality=SAVE_JPG_QUALITY,
+# Same result as 'get_bw_image_from_alpha' but the png is decompressed and decoded in
+# strips of rows, keeping only the downsampled alpha of each strip. Peak memory is a
+# strip of the rgba image rather than the whole image. Each strip is decoded as a
+# small uncompressed png whose first row is the (unfiltered) last row of the previous
+# strip, so that the row filters referencing the row above still work. Anything other
+# than an 8-bit, non-interlaced rgba png falls back to the full decode.
+def get_bw_image_from_alpha_in_strips(
+    rgba_file: str, strip_height: int = ALPHA_STRIP_HEIGHT
+) -> cv.typing.MatLike:
+    assert strip_height % BW_IMAGE_SCALE == 0
+
+    header = get_png_header(rgba_file)
+    if header.bit_depth != 8 or header.color_type != PNG_COLOR_TYPE_RGBA or header.interlace:
+        return get_bw_image_from_alpha(rgba_file)
+
+    row_len = header.get_row_len()
+    binary_strips = []
+    prev_row = b""
+    for filtered_rows in iter_png_filtered_rows(rgba_file, strip_height):
+        num_rows = len(filtered_rows) // row_len
+        num_prev_rows = 1 if prev_row else 0
+
+        strip_header = PngHeader(header.width, num_prev_rows + num_rows, 8, PNG_COLOR_TYPE_RGBA, 0)
+        strip = cv.imdecode(
+            np.frombuffer(make_png(strip_header, prev_row + filtered_rows), np.uint8),
+            cv.IMREAD_UNCHANGED,
+        )
+        if strip is None:
+            raise Exception(f'Could not decode png strip from "{rgba_file}".')
+
+        # Decoded rows are BGRA - the filters need the original RGBA byte order.
+        prev_row = b"\0" + strip[-1][:, [2, 1, 0, 3]].tobytes()
+
+        # A last strip of only a row or two downsamples to nothing.
+        if round(num_rows / BW_IMAGE_SCALE) == 0:
+            continue
+
+        alpha = strip[num_prev_rows:, :, 3]
+        alpha = cv.resize(
+            alpha,
+            (0, 0),
+            fx=1.0 / BW_IMAGE_SCALE,
+            fy=1.0 / BW_IMAGE_SCALE,
+            interpolation=cv.INTER_AREA,
+        )
+        binary_strips.append(np.uint8(255 - alpha))
+
+    return np.vstack(binary_strips)
+
+
+def get_bw_images_from_alpha(
+    rgba_files: List[str], max_workers: int = BW_IMAGE_MAX_WORKERS
+) -> List[cv.typing.MatLike]:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(get_bw_image_from_alpha_in_strips, rgba_files))
+
+
+# For very large pages - the png is filtered and deflated on several threads. See
+# 'write_png_parallel'.
+def save_png_parallel(
+    image: Image.Image,
+    png_file: str,
+    compress_level: int = SAVE_PNG_COMPRESSION,
+    max_workers: Optional[int] = None,
+) -> None:
+    if image.mode not in ["L", "LA", "RGB", "RGBA"]:
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+    write_png_parallel(png_file, np.asarray(image), compress_level, max_workers)
+
+
+# With 'reencode' the image is first saved again at SAVE_JPG_QUALITY. Either way the
+# metadata is written as COM segments.
+def add_jpg_metadata(jpg_file: str, metadata: Dict[str, str], reencode: bool = False):
+    if reencode:
+        pil_image = Image.open(jpg_file, "r")
+        pil_image.save(
+            jpg_file,
+            optimize=True,
+            compress_level=SAVE_JPG_COMPRESS_LEVEL,
+            quality=SAVE_JPG_QUALITY,
+        )
+
+    write_jpg_comment_segments(
+        jpg_file, {f"{METADATA_PROPERTY_GROUP}:{key}": metadata[key] for key in metadata}
     )
 
 
-def add_png_metadata(png_file: str, metadata: Dict[str, str]):
+def add_png_metadata(png_file: str, metadata: Dict[str, str], reencode: bool = False):
+    if not reencode:
+        write_png_text_chunks(
+            png_file, {f"{METADATA_PROPERTY_GROUP}:{key}": metadata[key] for key in metadata}
+        )
+        return
+
     pil_image = Image.open(png_file, "r")
 
     png_metadata = PngInfo()
@@ -71,11 +169,15 @@ def get_png_metadata(png_file: str) -> Dict[str, str]:
 
 
 def get_jpg_metadata(jpg_file: str) -> Dict[str, str]:
-    pil_image = Image.open(jpg_file, "r")
-
-    jpg_comments = pil_image.app["COM"]
+    text, plain_comments = get_jpg_comment_text(read_jpg_comment_segments(jpg_file))
 
+    prefix = METADATA_PROPERTY_GROUP + ":"
     metadata = dict()
-    metadata["comments"] = jpg_comments
+    for key in text:
+        if key.startswith(prefix):
+            metadata[key[len(prefix) :]] = text[key]
+
+    if plain_comments:
+        metadata["comments"] = plain_comments[-1].decode("utf-8", errors="replace")
 
     return metadata
@@ -1,12 +1,16 @@
+import hashlib
+import json
 import logging
 import os
 import re
 from datetime import datetime
 from pathlib import Path
-from typing import Union, List
+from typing import Any, Union, List
 
 from .comics_consts import BARKS_ROOT_DIR
 
+HASH_BLOCK_SIZE = 1024 * 1024
+
 
 def get_work_dir(work_dir_root: str) -> str:
     os.makedirs(work_dir_root, exist_ok=True)
@@ -94,6 +98,28 @@ def file_is_older_than_timestamp(file: str, timestamp: float) -> bool:
     return file_timestamp < timestamp
 
 
+def get_file_sha1(file: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+# Writes to a temp file first and then replaces 'json_file', so readers never see a
+# partly written file. The temp file name is per process so that processes writing the
+# same file don't clash.
+def write_json_file(json_file: str, contents: Any) -> None:
+    temp_file = f"{json_file}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, "w") as f:
+            json.dump(contents, f, indent=4)
+        os.replace(temp_file, json_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
 def setup_logging(log_level) -> None:
     logging.basicConfig(
         format="%(asctime)s %(levelname)s: %(message)s",
@@ -0,0 +1,194 @@
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from .comics_image_io import (
+    SAVE_JPG_COMPRESS_LEVEL,
+    SAVE_JPG_QUALITY,
+    SAVE_PNG_COMPRESSION,
+    add_jpg_metadata,
+    add_png_metadata,
+    save_png_parallel,
+)
+from .comics_info import JPG_FILE_EXT, PNG_FILE_EXT
+from .comics_utils import get_abbrev_path
+
+IMAGE_WRITER_MAX_WORKERS = 4
+IMAGE_WRITER_MAX_QUEUED = 8
+
+
+@dataclass(frozen=True)
+class SaveProfile:
+    name: str
+    png_compress_level: int
+    png_optimize: bool
+    jpg_quality: int
+    jpg_optimize: bool
+    # Encode pngs on several threads (without Pillow's 'optimize').
+    png_parallel: bool = False
+
+
+# Final images - the smallest files, regardless of encode time.
+ARCHIVAL_SAVE_PROFILE = SaveProfile(
+    "archival",
+    png_compress_level=SAVE_PNG_COMPRESSION,
+    png_optimize=True,
+    jpg_quality=SAVE_JPG_QUALITY,
+    jpg_optimize=True,
+)
+# Intermediate work files that only live until the next step reads them.
+FAST_SAVE_PROFILE = SaveProfile(
+    "fast",
+    png_compress_level=1,
+    png_optimize=False,
+    jpg_quality=SAVE_JPG_QUALITY,
+    jpg_optimize=False,
+)
+# Final images too large to wait for a single-threaded encode.
+PARALLEL_ARCHIVAL_SAVE_PROFILE = SaveProfile(
+    "archival-parallel",
+    png_compress_level=SAVE_PNG_COMPRESSION,
+    png_optimize=False,
+    jpg_quality=SAVE_JPG_QUALITY,
+    jpg_optimize=True,
+    png_parallel=True,
+)
+
+SAVE_PROFILES: Dict[str, SaveProfile] = {
+    ARCHIVAL_SAVE_PROFILE.name: ARCHIVAL_SAVE_PROFILE,
+    FAST_SAVE_PROFILE.name: FAST_SAVE_PROFILE,
+    PARALLEL_ARCHIVAL_SAVE_PROFILE.name: PARALLEL_ARCHIVAL_SAVE_PROFILE,
+}
+
+
+# Saves via a temp file in the same dir so a partly written image is never seen under
+# the final name. Any metadata is spliced in afterwards without re-encoding.
+def save_image(
+    image: Image.Image,
+    file: str,
+    profile: SaveProfile = ARCHIVAL_SAVE_PROFILE,
+    metadata: Optional[Dict[str, str]] = None,
+) -> None:
+    file_stem, file_ext = os.path.splitext(file)
+    temp_file = file_stem + ".tmp" + file_ext
+
+    try:
+        if file_ext == PNG_FILE_EXT and profile.png_parallel:
+            save_png_parallel(image, temp_file, profile.png_compress_level)
+            if metadata:
+                add_png_metadata(temp_file, metadata)
+        elif file_ext == PNG_FILE_EXT:
+            image.save(
+                temp_file,
+                optimize=profile.png_optimize,
+                compress_level=profile.png_compress_level,
+            )
+            if metadata:
+                add_png_metadata(temp_file, metadata)
+        elif file_ext == JPG_FILE_EXT:
+            image.save(
+                temp_file,
+                optimize=profile.jpg_optimize,
+                compress_level=SAVE_JPG_COMPRESS_LEVEL,
+                quality=profile.jpg_quality,
+            )
+            if metadata:
+                add_jpg_metadata(temp_file, metadata)
+        else:
+            raise Exception(f'Unexpected image file extension: "{file}".')
+
+        os.replace(temp_file, file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+# Encodes and saves images on a pool of background threads. 'submit' blocks while the
+# queue is full, which bounds the number of decoded images held in memory. Save
+# errors are collected and raised together from 'wait' or 'close'.
+class ImageWriter:
+    def __init__(
+        self,
+        max_workers: int = IMAGE_WRITER_MAX_WORKERS,
+        max_queued: int = IMAGE_WRITER_MAX_QUEUED,
+    ):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queued)
+        self._errors: List[Tuple[str, Exception]] = []
+        self._errors_lock = threading.Lock()
+        self._closed = False
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f"image-writer-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self) -> "ImageWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't hide the original exception behind any save errors.
+            self._stop()
+
+    def submit(
+        self,
+        image: Image.Image,
+        file: str,
+        profile: SaveProfile = ARCHIVAL_SAVE_PROFILE,
+        metadata: Optional[Dict[str, str]] = None,
+    ) -> None:
+        if self._closed:
+            raise Exception("Image writer is closed.")
+        self._queue.put((image, file, profile, metadata))
+
+    # Waits for all submitted images to be saved.
+    def wait(self) -> None:
+        self._queue.join()
+        self._raise_errors()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._stop()
+        self._raise_errors()
+
+    def _stop(self) -> None:
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    break
+                image, file, profile, metadata = item
+                save_image(image, file, profile, metadata)
+                logging.debug(f'Saved image "{get_abbrev_path(file)}" ({profile.name}).')
+            except Exception as e:
+                with self._errors_lock:
+                    self._errors.append((file, e))
+            finally:
+                self._queue.task_done()
+
+    def _raise_errors(self) -> None:
+        with self._errors_lock:
+            errors = self._errors
+            self._errors = []
+        if not errors:
+            return
+
+        error_lines = [f'"{get_abbrev_path(file)}": {e}' for file, e in errors]
+        raise Exception(f"Could not save {len(errors)} image(s):\n" + "\n".join(error_lines))
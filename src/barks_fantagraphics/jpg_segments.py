@@ -0,0 +1,158 @@
+import os
+import struct
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+JPG_SOI_MARKER = 0xD8
+JPG_SOS_MARKER = 0xDA
+JPG_COM_MARKER = 0xFE
+JPG_APP0_MARKER = 0xE0
+JPG_APP15_MARKER = 0xEF
+JPG_MAX_SEGMENT_DATA_LEN = 0xFFFF - 2
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Keyword/value comments are stored as 'keyword\0value' in COM segments, mirroring png
+# text chunks. Any other COM segments are treated as plain comments.
+KEYWORD_SEPARATOR = b"\0"
+
+
+# Adds or replaces keyword comments in a jpg file without touching the entropy-coded
+# image data. The header segments are streamed into a temp file: existing COM
+# segments with the same keywords are dropped, the new COM segments are inserted
+# after the leading APPn segments (JFIF, Exif, etc.), and everything from the
+# start-of-scan segment onwards is copied unchanged. The temp file then
+# atomically replaces the original.
+def write_jpg_comment_segments(jpg_file: str, text: Dict[str, str]) -> None:
+    new_segments = [_get_comment_segment(keyword, text[keyword]) for keyword in text]
+    replaced_keywords = set(text)
+
+    temp_file = jpg_file + ".tmp"
+    try:
+        with open(jpg_file, "rb") as srce, open(temp_file, "wb") as dest:
+            if srce.read(2) != bytes([0xFF, JPG_SOI_MARKER]):
+                raise Exception(f'Not a jpg file: "{jpg_file}".')
+            dest.write(bytes([0xFF, JPG_SOI_MARKER]))
+
+            inserted = False
+            while True:
+                marker, data = _read_segment(srce, jpg_file)
+
+                if marker == JPG_COM_MARKER:
+                    keyword_and_value = _split_comment(data)
+                    if keyword_and_value and keyword_and_value[0] in replaced_keywords:
+                        continue
+                elif not inserted and not JPG_APP0_MARKER <= marker <= JPG_APP15_MARKER:
+                    dest.write(b"".join(new_segments))
+                    inserted = True
+
+                dest.write(_get_segment(marker, data))
+
+                if marker == JPG_SOS_MARKER:
+                    break
+
+            while True:
+                buffer = srce.read(COPY_BUFFER_SIZE)
+                if not buffer:
+                    break
+                dest.write(buffer)
+
+        os.replace(temp_file, jpg_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def read_jpg_comment_segments(jpg_file: str) -> List[bytes]:
+    with open(jpg_file, "rb") as f:
+        if f.read(2) != bytes([0xFF, JPG_SOI_MARKER]):
+            raise Exception(f'Not a jpg file: "{jpg_file}".')
+
+        comments = []
+        while True:
+            marker, data = _read_segment(f, jpg_file)
+            if marker == JPG_SOS_MARKER:
+                break
+            if marker == JPG_COM_MARKER:
+                comments.append(data)
+
+    return comments
+
+
+# Reads the COM segments before the entropy-coded data from a bytes-like object,
+# such as an mmap of the file.
+def get_jpg_comment_segments(buffer, jpg_file: str = "") -> List[bytes]:
+    if buffer[:2] != bytes([0xFF, JPG_SOI_MARKER]):
+        raise Exception(f'Not a jpg file: "{jpg_file}".')
+
+    comments = []
+    pos = 2
+    while pos + 4 <= len(buffer):
+        if buffer[pos] != 0xFF:
+            raise Exception(f'Invalid jpg segment marker in "{jpg_file}".')
+        if buffer[pos + 1] == 0xFF:
+            pos += 1
+            continue
+
+        marker = buffer[pos + 1]
+        if marker == JPG_SOS_MARKER:
+            break
+        (length,) = struct.unpack_from(">H", buffer, pos + 2)
+        if marker == JPG_COM_MARKER:
+            comments.append(bytes(buffer[pos + 4 : pos + 2 + length]))
+        pos += length + 2
+
+    return comments
+
+
+def get_jpg_comment_text(comments: List[bytes]) -> Tuple[Dict[str, str], List[bytes]]:
+    text = {}
+    plain_comments = []
+    for comment in comments:
+        keyword_and_value = _split_comment(comment)
+        if keyword_and_value:
+            text[keyword_and_value[0]] = keyword_and_value[1]
+        else:
+            plain_comments.append(comment)
+
+    return text, plain_comments
+
+
+def _read_segment(f: BinaryIO, jpg_file: str) -> Tuple[int, bytes]:
+    marker_bytes = f.read(2)
+    # Markers may be preceded by any number of 0xFF fill bytes.
+    while marker_bytes[1:2] == b"\xff":
+        marker_bytes = marker_bytes[1:] + f.read(1)
+    if len(marker_bytes) != 2 or marker_bytes[0] != 0xFF:
+        raise Exception(f'Invalid jpg segment marker in "{jpg_file}".')
+
+    length_bytes = f.read(2)
+    if len(length_bytes) != 2:
+        raise Exception(f'Unexpected end of jpg file: "{jpg_file}".')
+    (length,) = struct.unpack(">H", length_bytes)
+    data = f.read(length - 2)
+    if len(data) != length - 2:
+        raise Exception(f'Unexpected end of jpg file: "{jpg_file}".')
+
+    return marker_bytes[1], data
+
+
+def _get_segment(marker: int, data: bytes) -> bytes:
+    return bytes([0xFF, marker]) + struct.pack(">H", len(data) + 2) + data
+
+
+def _get_comment_segment(keyword: str, value: str) -> bytes:
+    data = keyword.encode("utf-8") + KEYWORD_SEPARATOR + value.encode("utf-8")
+    if len(data) > JPG_MAX_SEGMENT_DATA_LEN:
+        raise Exception(f'Jpg comment for "{keyword}" is too long: {len(data)} bytes.')
+
+    return _get_segment(JPG_COM_MARKER, data)
+
+
+def _split_comment(comment: bytes) -> Optional[Tuple[str, str]]:
+    if KEYWORD_SEPARATOR not in comment:
+        return None
+    keyword, value = comment.split(KEYWORD_SEPARATOR, 1)
+    try:
+        return keyword.decode("utf-8"), value.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
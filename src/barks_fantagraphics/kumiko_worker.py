@@ -0,0 +1,57 @@
+# Long-lived kumiko worker. This script is run with kumiko's own venv python (it only
+# uses the standard library), so kumiko and its imports (opencv, numpy, etc.) are
+# loaded once rather than once per page.
+#
+# Usage: kumiko_worker.py <kumiko-script>
+#
+# Requests are read from stdin, one json object per line: {"image": "<page-file>"}.
+# Each gets one json line back on stdout: {"ok": true, "result": <kumiko json>} or
+# {"ok": false, "error": "<message>"}. The worker exits when stdin is closed.
+
+import contextlib
+import io
+import json
+import os
+import runpy
+import sys
+import traceback
+
+
+def run_kumiko(kumiko_script: str, image_file: str) -> str:
+    saved_argv = sys.argv
+    sys.argv = [kumiko_script, "-i", image_file]
+    kumiko_output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(kumiko_output):
+            runpy.run_path(kumiko_script, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in [None, 0]:
+            raise Exception(f"kumiko exited with code {e.code}.")
+    finally:
+        sys.argv = saved_argv
+
+    return kumiko_output.getvalue()
+
+
+def main() -> None:
+    kumiko_script = sys.argv[1]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(kumiko_script)))
+
+    protocol_out = sys.stdout
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            result = json.loads(run_kumiko(kumiko_script, request["image"]))
+            response = {"ok": True, "result": result}
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+        protocol_out.write(json.dumps(response) + "\n")
+        protocol_out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import json
+import logging
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .comics_consts import CATALOG_CACHE_SUBDIR, METADATA_PROPERTY_GROUP
+from .comics_database import ComicsDatabase
+from .comics_info import JPG_FILE_EXT, PNG_FILE_EXT
+from .comics_utils import get_relpath, write_json_file
+from .jpg_segments import get_jpg_comment_segments, get_jpg_comment_text
+from .png_chunks import get_png_text
+
+METADATA_INDEX_FORMAT_VERSION = 1
+METADATA_SCAN_MAX_WORKERS = 16
+
+
+@dataclass
+class MetadataIndexEntry:
+    size: int
+    mtime_ns: int
+    metadata: Dict[str, str]
+
+
+# Index of the BARKS:* metadata of every png and jpg file in a set of image dirs.
+# It is built by reading only the chunks or segments before the image data and can
+# then be queried without opening the images again.
+class MetadataIndex:
+    def __init__(self, entries: Dict[str, MetadataIndexEntry]):
+        self._entries = entries
+
+    def get_files(self) -> List[str]:
+        return sorted(self._entries)
+
+    def get_entry(self, file: str) -> Optional[MetadataIndexEntry]:
+        return self._entries.get(file)
+
+    def get_metadata(self, file: str) -> Dict[str, str]:
+        return self._entries[file].metadata
+
+    def get_files_with_key(self, key: str, value: Optional[str] = None) -> List[str]:
+        return sorted(
+            file
+            for file, entry in self._entries.items()
+            if key in entry.metadata and (value is None or entry.metadata[key] == value)
+        )
+
+    def get_files_without_key(self, key: str) -> List[str]:
+        return sorted(file for file, entry in self._entries.items() if key not in entry.metadata)
+
+
+def get_volume_metadata_index_file(comics_database: ComicsDatabase, volume_num: int) -> str:
+    return os.path.join(
+        comics_database.get_comics_database_dir(),
+        CATALOG_CACHE_SUBDIR,
+        f"metadata-index-vol-{volume_num:02d}.json",
+    )
+
+
+def get_volume_image_dirs(comics_database: ComicsDatabase, volume_num: int) -> List[str]:
+    return [
+        comics_database.get_fantagraphics_volume_image_dir(volume_num),
+        comics_database.get_fantagraphics_upscayled_volume_image_dir(volume_num),
+        comics_database.get_fantagraphics_restored_volume_image_dir(volume_num),
+        comics_database.get_fantagraphics_restored_upscayled_volume_image_dir(volume_num),
+        comics_database.get_fantagraphics_fixes_volume_image_dir(volume_num),
+        comics_database.get_fantagraphics_upscayled_fixes_volume_image_dir(volume_num),
+        comics_database.get_fantagraphics_restored_fixes_volume_image_dir(volume_num),
+    ]
+
+
+def get_volume_metadata_index(
+    comics_database: ComicsDatabase,
+    volume_num: int,
+    max_workers: int = METADATA_SCAN_MAX_WORKERS,
+) -> MetadataIndex:
+    return scan_metadata(
+        get_volume_image_dirs(comics_database, volume_num),
+        get_volume_metadata_index_file(comics_database, volume_num),
+        max_workers,
+    )
+
+
+# Scans the image dirs and saves the updated index. Entries whose size and mtime are
+# unchanged since the last scan are reused without reading the file.
+def scan_metadata(
+    image_dirs: List[str], index_file: str, max_workers: int = METADATA_SCAN_MAX_WORKERS
+) -> MetadataIndex:
+    start = time.time()
+
+    image_files = []
+    for image_dir in image_dirs:
+        if os.path.isdir(image_dir):
+            image_files.extend(_get_image_files(image_dir))
+
+    prev_index = load_metadata_index(index_file)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        entries = list(
+            executor.map(lambda f: _get_index_entry(f, prev_index.get_entry(f)), image_files)
+        )
+    index = MetadataIndex(
+        {file: entry for file, entry in zip(image_files, entries) if entry is not None}
+    )
+
+    save_metadata_index(index, index_file)
+
+    logging.debug(
+        f"Scanned metadata for {len(image_files)} files in {time.time() - start:.2f}s"
+        f' into "{get_relpath(index_file)}".'
+    )
+
+    return index
+
+
+def save_metadata_index(index: MetadataIndex, index_file: str) -> None:
+    index_json = {
+        "format_version": METADATA_INDEX_FORMAT_VERSION,
+        "files": {
+            file: [entry.size, entry.mtime_ns, entry.metadata]
+            for file, entry in ((f, index.get_entry(f)) for f in index.get_files())
+        },
+    }
+
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    write_json_file(index_file, index_json)
+
+
+def load_metadata_index(index_file: str) -> MetadataIndex:
+    if not os.path.isfile(index_file):
+        return MetadataIndex({})
+
+    try:
+        with open(index_file, "r") as f:
+            index_json = json.load(f)
+        if index_json["format_version"] != METADATA_INDEX_FORMAT_VERSION:
+            return MetadataIndex({})
+
+        return MetadataIndex(
+            {
+                file: MetadataIndexEntry(size, mtime_ns, metadata)
+                for file, (size, mtime_ns, metadata) in index_json["files"].items()
+            }
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        logging.warning(f'Could not load metadata index "{index_file}": {e}')
+        return MetadataIndex({})
+
+
+def _get_image_files(image_dir: str) -> List[str]:
+    with os.scandir(image_dir) as entries:
+        return [
+            entry.path
+            for entry in entries
+            if entry.is_file() and os.path.splitext(entry.name)[1] in [PNG_FILE_EXT, JPG_FILE_EXT]
+        ]
+
+
+def _get_index_entry(
+    image_file: str, prev_entry: Optional[MetadataIndexEntry]
+) -> Optional[MetadataIndexEntry]:
+    try:
+        stat = os.stat(image_file)
+        if (
+            prev_entry is not None
+            and prev_entry.size == stat.st_size
+            and prev_entry.mtime_ns == stat.st_mtime_ns
+        ):
+            return prev_entry
+
+        return MetadataIndexEntry(stat.st_size, stat.st_mtime_ns, _read_metadata(image_file))
+    except Exception as e:
+        logging.warning(f'Could not read metadata from "{get_relpath(image_file)}": {e}')
+        return None
+
+
+def _read_metadata(image_file: str) -> Dict[str, str]:
+    with open(image_file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if image_file.endswith(PNG_FILE_EXT):
+                text = get_png_text(buffer, image_file)
+            else:
+                text, _ = get_jpg_comment_text(get_jpg_comment_segments(buffer, image_file))
+
+    prefix = METADATA_PROPERTY_GROUP + ":"
+    return {key[len(prefix) :]: text[key] for key in text if key.startswith(prefix)}
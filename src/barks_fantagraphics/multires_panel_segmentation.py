@@ -0,0 +1,157 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .panel_segmentation import PanelSegmenter
+from .panel_segments_cache import PanelSegmentsCache
+
+DEFAULT_REDUCE_FACTOR = 4
+# Half-width, in full size pixels, of the band searched around each rescaled edge.
+DEFAULT_REFINE_BAND = 12
+# Gray values below this are panel border ink.
+REFINE_INK_THRESHOLD = 128
+# Fraction of a row or column of the band that must be ink to count as a border.
+REFINE_MIN_INK_FRACTION = 0.5
+
+
+# Runs another segmenter on a reduced decode of the page and scales its panels back up
+# to full size. For jpgs the reduction happens in the decoder ('Image.draft'), so the
+# full size pixels are never decoded; otherwise 'Image.reduce' is used. Optionally,
+# each rescaled panel edge is then snapped to the panel border found in a narrow
+# band of the full size page.
+class MultiResolutionPanelSegmentation(PanelSegmenter):
+    def __init__(
+        self,
+        segmenter: PanelSegmenter,
+        cache: Optional[PanelSegmentsCache] = None,
+        reduce_factor: int = DEFAULT_REDUCE_FACTOR,
+        refine_edges: bool = False,
+        refine_band: int = DEFAULT_REFINE_BAND,
+    ):
+        super().__init__(cache)
+        self._segmenter = segmenter
+        self._reduce_factor = reduce_factor
+        self._refine_edges = refine_edges
+        self._refine_band = refine_band
+
+    def get_segmenter_id(self) -> str:
+        return f"multires-{self._segmenter.get_segmenter_id()}"
+
+    def get_segmenter_params(self) -> Dict[str, Any]:
+        return {
+            "segmenter_params": self._segmenter.get_segmenter_params(),
+            "reduce_factor": self._reduce_factor,
+            "refine_edges": self._refine_edges,
+            "refine_band": self._refine_band,
+        }
+
+    def _segment_page(
+        self, srce_image: Optional[Image.Image], srce_filename: str
+    ) -> Dict[str, Any]:
+        reduced_image, full_size = self._get_reduced_image(srce_image, srce_filename)
+
+        segment_info = self._segmenter._segment_page(reduced_image, srce_filename)
+
+        scale_x = full_size[0] / reduced_image.size[0]
+        scale_y = full_size[1] / reduced_image.size[1]
+        panels = [
+            _get_rescaled_panel(panel, scale_x, scale_y, full_size)
+            for panel in segment_info["panels"]
+        ]
+
+        if self._refine_edges:
+            full_image = Image.open(srce_filename) if srce_image is None else srce_image
+            panels = [_get_refined_panel(full_image, panel, self._refine_band) for panel in panels]
+
+        return {
+            **segment_info,
+            "filename": srce_filename,
+            "size": list(full_size),
+            "panels": panels,
+        }
+
+    def _get_reduced_image(
+        self, srce_image: Optional[Image.Image], srce_filename: str
+    ) -> Tuple[Image.Image, Tuple[int, int]]:
+        opened_image = srce_image is None
+        if opened_image:
+            srce_image = Image.open(srce_filename)
+        full_size = srce_image.size
+        target_size = (
+            max(1, full_size[0] // self._reduce_factor),
+            max(1, full_size[1] // self._reduce_factor),
+        )
+
+        # Only does anything for a jpg that hasn't been loaded yet. A caller's image is
+        # left alone as 'draft' changes the image in place.
+        if opened_image:
+            srce_image.draft(srce_image.mode, target_size)
+
+        remaining_factor = max(1, srce_image.size[0] // target_size[0])
+        if remaining_factor > 1:
+            return srce_image.reduce(remaining_factor), full_size
+
+        # A copy so that segmenters reading the file by name don't use the full size file.
+        return srce_image.copy(), full_size
+
+
+def _get_rescaled_panel(
+    panel: List[int], scale_x: float, scale_y: float, full_size: Tuple[int, int]
+) -> List[int]:
+    x0 = max(0, int(round(panel[0] * scale_x)))
+    y0 = max(0, int(round(panel[1] * scale_y)))
+    x1 = min(full_size[0], int(round((panel[0] + panel[2]) * scale_x)))
+    y1 = min(full_size[1], int(round((panel[1] + panel[3]) * scale_y)))
+
+    return [x0, y0, x1 - x0, y1 - y0]
+
+
+# Only the bands around the panel edges are cropped from the full size page and
+# converted to grayscale.
+def _get_refined_panel(full_image: Image.Image, panel: List[int], band: int) -> List[int]:
+    width, height = full_image.size
+    x0, y0 = panel[0], panel[1]
+    x1, y1 = panel[0] + panel[2], panel[1] + panel[3]
+
+    def get_band_ink(box: Tuple[int, int, int, int], axis: int) -> np.ndarray:
+        gray_band = np.asarray(full_image.crop(box).convert("L"))
+        return (gray_band < REFINE_INK_THRESHOLD).mean(axis=axis)
+
+    # Ink fraction of each column or row of a band along an edge, measured over the
+    # middle half of the edge to keep clear of neighbouring panels at the corners.
+    def get_column_ink(band_x0: int, band_x1: int) -> np.ndarray:
+        rows = (y0 + (y1 - y0) // 4, y1 - (y1 - y0) // 4)
+        return get_band_ink((band_x0, rows[0], band_x1, rows[1]), axis=0)
+
+    def get_row_ink(band_y0: int, band_y1: int) -> np.ndarray:
+        columns = (x0 + (x1 - x0) // 4, x1 - (x1 - x0) // 4)
+        return get_band_ink((columns[0], band_y0, columns[1], band_y1), axis=1)
+
+    left_band = (max(0, x0 - band), min(width, x0 + band))
+    right_band = (max(0, x1 - band), min(width, x1 + band))
+    top_band = (max(0, y0 - band), min(height, y0 + band))
+    bottom_band = (max(0, y1 - band), min(height, y1 + band))
+
+    new_x0 = _get_outer_border(get_column_ink(*left_band), left_band[0], first=True)
+    new_x1 = _get_outer_border(get_column_ink(*right_band), right_band[0], first=False)
+    new_y0 = _get_outer_border(get_row_ink(*top_band), top_band[0], first=True)
+    new_y1 = _get_outer_border(get_row_ink(*bottom_band), bottom_band[0], first=False)
+
+    x0 = x0 if new_x0 is None else new_x0
+    x1 = x1 if new_x1 is None else new_x1 + 1
+    y0 = y0 if new_y0 is None else new_y0
+    y1 = y1 if new_y1 is None else new_y1 + 1
+    if x1 <= x0 or y1 <= y0:
+        return panel
+
+    return [x0, y0, x1 - x0, y1 - y0]
+
+
+# Position of the outermost border line in a band, or None if there isn't one.
+def _get_outer_border(ink: np.ndarray, band_start: int, first: bool) -> Optional[int]:
+    border_positions = np.flatnonzero(ink >= REFINE_MIN_INK_FRACTION)
+    if border_positions.size == 0:
+        return None
+
+    return band_start + int(border_positions[0] if first else border_positions[-1])
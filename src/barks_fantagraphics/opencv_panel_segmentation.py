@@ -0,0 +1,157 @@
+from typing import Any, Dict, List, Optional
+
+import cv2 as cv
+import numpy as np
+from PIL import Image
+
+from .comics_utils import get_abbrev_path
+from .panel_segmentation import PanelSegmenter
+from .panel_segments_cache import PanelSegmentsCache
+
+# Bump this when the detection changes to invalidate cached results.
+OPENCV_SEGMENTER_ID = "opencv-1"
+
+DEFAULT_DETECT_MAX_DIM = 1200
+# Gray values at or above this are paper (gutters and margins).
+DEFAULT_PAPER_THRESHOLD = 230
+DEFAULT_MIN_PANEL_AREA_FRACTION = 0.01
+# Closes small breaks in panel borders, in detection image pixels.
+DEFAULT_CLOSE_KERNEL_SIZE = 3
+
+
+# In-process panel detection. The page is reduced to grayscale at no more than
+# 'detect_max_dim' pixels, everything darker than the paper is treated as ink, and
+# each external contour of the ink becomes a panel candidate. Candidates that are too
+# small, or lie inside another candidate, are dropped, and the rest are put in reading
+# order (rows top to bottom, then left to right).
+class OpenCvPanelSegmentation(PanelSegmenter):
+    def __init__(
+        self,
+        cache: Optional[PanelSegmentsCache] = None,
+        detect_max_dim: int = DEFAULT_DETECT_MAX_DIM,
+        paper_threshold: int = DEFAULT_PAPER_THRESHOLD,
+        min_panel_area_fraction: float = DEFAULT_MIN_PANEL_AREA_FRACTION,
+        close_kernel_size: int = DEFAULT_CLOSE_KERNEL_SIZE,
+    ):
+        super().__init__(cache)
+        self._detect_max_dim = detect_max_dim
+        self._paper_threshold = paper_threshold
+        self._min_panel_area_fraction = min_panel_area_fraction
+        self._close_kernel_size = close_kernel_size
+
+    def get_segmenter_id(self) -> str:
+        return OPENCV_SEGMENTER_ID
+
+    def get_segmenter_params(self) -> Dict[str, Any]:
+        return {
+            "detect_max_dim": self._detect_max_dim,
+            "paper_threshold": self._paper_threshold,
+            "min_panel_area_fraction": self._min_panel_area_fraction,
+            "close_kernel_size": self._close_kernel_size,
+        }
+
+    def detect_panels(self, gray_image: np.ndarray) -> List[List[int]]:
+        return detect_panels(
+            gray_image,
+            self._detect_max_dim,
+            self._paper_threshold,
+            self._min_panel_area_fraction,
+            self._close_kernel_size,
+        )
+
+    def _segment_page(
+        self, srce_image: Optional[Image.Image], srce_filename: str
+    ) -> Dict[str, Any]:
+        gray_image = get_gray_image(srce_image, srce_filename)
+        height, width = gray_image.shape
+
+        return {
+            "filename": srce_filename,
+            "size": [width, height],
+            "panels": self.detect_panels(gray_image),
+        }
+
+
+def get_gray_image(srce_image: Optional[Image.Image], srce_filename: str) -> np.ndarray:
+    if srce_image is None:
+        gray_image = cv.imread(srce_filename, cv.IMREAD_GRAYSCALE)
+        if gray_image is None:
+            raise Exception(f'Could not read image "{get_abbrev_path(srce_filename)}".')
+        return gray_image
+
+    return np.asarray(srce_image.convert("L"))
+
+
+# Returns [x, y, w, h] panel boxes in 'gray_image' pixels.
+def detect_panels(
+    gray_image: np.ndarray,
+    detect_max_dim: int = DEFAULT_DETECT_MAX_DIM,
+    paper_threshold: int = DEFAULT_PAPER_THRESHOLD,
+    min_panel_area_fraction: float = DEFAULT_MIN_PANEL_AREA_FRACTION,
+    close_kernel_size: int = DEFAULT_CLOSE_KERNEL_SIZE,
+) -> List[List[int]]:
+    height, width = gray_image.shape
+    scale = min(1.0, detect_max_dim / max(height, width))
+    if scale < 1.0:
+        detect_image = cv.resize(
+            gray_image, (0, 0), fx=scale, fy=scale, interpolation=cv.INTER_AREA
+        )
+    else:
+        detect_image = gray_image
+
+    ink = np.uint8(detect_image < paper_threshold) * np.uint8(255)
+    if close_kernel_size > 1:
+        kernel = np.ones((close_kernel_size, close_kernel_size), np.uint8)
+        ink = cv.morphologyEx(ink, cv.MORPH_CLOSE, kernel)
+
+    contours, _ = cv.findContours(ink, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
+    min_area = min_panel_area_fraction * detect_image.shape[0] * detect_image.shape[1]
+    boxes = [list(cv.boundingRect(contour)) for contour in contours]
+    boxes = [box for box in boxes if box[2] * box[3] >= min_area]
+    boxes = _get_reading_order(_remove_contained_boxes(boxes))
+
+    return [_get_rescaled_box(box, scale, width, height) for box in boxes]
+
+
+def _remove_contained_boxes(boxes: List[List[int]]) -> List[List[int]]:
+    def is_inside(inner: List[int], outer: List[int]) -> bool:
+        return (
+            outer[0] <= inner[0]
+            and outer[1] <= inner[1]
+            and inner[0] + inner[2] <= outer[0] + outer[2]
+            and inner[1] + inner[3] <= outer[1] + outer[3]
+        )
+
+    # Of any identical boxes, only the first is kept.
+    return [
+        box
+        for i, box in enumerate(boxes)
+        if not any(
+            j != i and is_inside(box, other) and (box != other or j < i)
+            for j, other in enumerate(boxes)
+        )
+    ]
+
+
+# A box belongs to the current row if its vertical center is above the row's bottom.
+def _get_reading_order(boxes: List[List[int]]) -> List[List[int]]:
+    rows: List[List[List[int]]] = []
+    row_bottom = -1
+    for box in sorted(boxes, key=lambda b: (b[1], b[0])):
+        if rows and box[1] + box[3] // 2 < row_bottom:
+            rows[-1].append(box)
+            row_bottom = max(row_bottom, box[1] + box[3])
+        else:
+            rows.append([box])
+            row_bottom = box[1] + box[3]
+
+    return [box for row in rows for box in sorted(row, key=lambda b: b[0])]
+
+
+def _get_rescaled_box(box: List[int], scale: float, width: int, height: int) -> List[int]:
+    x0 = max(0, int(round(box[0] / scale)))
+    y0 = max(0, int(round(box[1] / scale)))
+    x1 = min(width, int(round((box[0] + box[2]) / scale)))
+    y1 = min(height, int(round((box[1] + box[3]) / scale)))
+
+    return [x0, y0, x1 - x0, y1 - y0]
@@ -1,16 +1,35 @@
 import json
 import logging
 import os
+import queue
 import subprocess
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from PIL import Image
 
+from barks_fantagraphics.comics_info import JPG_FILE_EXT, PNG_FILE_EXT
 from barks_fantagraphics.comics_utils import get_abbrev_path
+from barks_fantagraphics.panel_segments_cache import PanelSegmentsCache, get_panel_segments_key
 
 BIG_NUM = 10000
 
+KUMIKO_HOME_DIR = os.path.join(str(Path.home()), "Prj/github/kumiko")
+KUMIKO_PYTHON_PATH = os.path.join(KUMIKO_HOME_DIR, ".venv/bin/python3")
+KUMIKO_SCRIPT_PATH = os.path.join(KUMIKO_HOME_DIR, "kumiko")
+KUMIKO_WORKER_SCRIPT_PATH = os.path.join(os.path.dirname(__file__), "kumiko_worker.py")
+KUMIKO_WORKER_EXIT_TIMEOUT = 10
+# Bump this to invalidate cached results after upgrading kumiko.
+KUMIKO_SEGMENTER_ID = "kumiko-1"
+
+# Image files kumiko (opencv) can read as is.
+KUMIKO_IMAGE_FILE_EXTS = [JPG_FILE_EXT, PNG_FILE_EXT]
+# In-memory filesystem for handing pixels over to kumiko, if there is one.
+SHARED_MEMORY_DIR = "/dev/shm"
+
 
 def get_min_max_panel_values(segment_info: Dict[str, Any]) -> Tuple[int, int, int, int]:
     x_min = BIG_NUM
@@ -41,35 +60,276 @@ def get_min_max_panel_values(segment_info: Dict[str, Any]) -> Tuple[int, int, in
     return x_min, y_min, x_max, y_max
 
 
-class KumikoPanelSegmentation:
-    def __init__(self, work_dir: str):
+@dataclass
+class PanelsAgreement:
+    num_panels_a: int
+    num_panels_b: int
+    num_matched: int
+    mean_iou: float
+
+    def is_full_agreement(self) -> bool:
+        return self.num_panels_a == self.num_panels_b == self.num_matched
+
+
+def get_panel_iou(panel_a: List[int], panel_b: List[int]) -> float:
+    x0 = max(panel_a[0], panel_b[0])
+    y0 = max(panel_a[1], panel_b[1])
+    x1 = min(panel_a[0] + panel_a[2], panel_b[0] + panel_b[2])
+    y1 = min(panel_a[1] + panel_a[3], panel_b[1] + panel_b[3])
+    if x1 <= x0 or y1 <= y0:
+        return 0.0
+
+    intersection = (x1 - x0) * (y1 - y0)
+    union = panel_a[2] * panel_a[3] + panel_b[2] * panel_b[3] - intersection
+
+    return intersection / union
+
+
+# Compares two segmentations of the same page. Panels are paired greedily, best
+# IoU first, and a pair only counts as matched if its IoU is at least 'min_iou'.
+def get_panels_agreement(
+    panels_a: List[List[int]], panels_b: List[List[int]], min_iou: float = 0.8
+) -> PanelsAgreement:
+    pairs = sorted(
+        (
+            (get_panel_iou(panel_a, panel_b), i, j)
+            for i, panel_a in enumerate(panels_a)
+            for j, panel_b in enumerate(panels_b)
+        ),
+        reverse=True,
+    )
+
+    used_a = set()
+    used_b = set()
+    matched_ious = []
+    for iou, i, j in pairs:
+        if iou < min_iou:
+            break
+        if i in used_a or j in used_b:
+            continue
+        used_a.add(i)
+        used_b.add(j)
+        matched_ious.append(iou)
+
+    mean_iou = sum(matched_ious) / len(matched_ious) if matched_ious else 0.0
+
+    return PanelsAgreement(len(panels_a), len(panels_b), len(matched_ious), mean_iou)
+
+
+# A kumiko process that stays running between pages. See 'kumiko_worker.py'.
+class KumikoWorker:
+    def __init__(self):
+        run_args = [KUMIKO_PYTHON_PATH, KUMIKO_WORKER_SCRIPT_PATH, KUMIKO_SCRIPT_PATH]
+        logging.debug(f"Starting kumiko worker: {' '.join(run_args)}.")
+        self._process = subprocess.Popen(
+            run_args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+
+    def is_running(self) -> bool:
+        return self._process.poll() is None
+
+    def get_segment_info(self, page_filename: str) -> Dict[str, Any]:
+        self._process.stdin.write(json.dumps({"image": page_filename}) + "\n")
+        self._process.stdin.flush()
+
+        response_line = self._process.stdout.readline()
+        if not response_line:
+            raise ChildProcessError(f"Kumiko worker exited with code {self._process.poll()}.")
+        response = json.loads(response_line)
+        if not response["ok"]:
+            raise Exception(f'Kumiko failed for "{page_filename}": {response["error"]}')
+
+        segment_info = response["result"]
+        assert len(segment_info) == 1
+
+        return segment_info[0]
+
+    def close(self) -> None:
+        if self._process.stdin:
+            self._process.stdin.close()
+        try:
+            self._process.wait(timeout=KUMIKO_WORKER_EXIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        if self._process.stdout:
+            self._process.stdout.close()
+
+
+# A pool of kumiko workers that can be shared between threads. Workers are started
+# when first needed, and a worker that dies is replaced on the next request.
+class KumikoWorkerPool:
+    def __init__(self, num_workers: int = 1):
+        self._idle_workers: queue.Queue = queue.Queue()
+        for _ in range(num_workers):
+            self._idle_workers.put(None)
+        self._num_workers = num_workers
+
+    def __enter__(self) -> "KumikoWorkerPool":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def get_segment_info(self, page_filename: str) -> Dict[str, Any]:
+        worker: Optional[KumikoWorker] = self._idle_workers.get()
+        try:
+            if worker is None:
+                worker = KumikoWorker()
+            return worker.get_segment_info(page_filename)
+        finally:
+            if worker is not None and not worker.is_running():
+                worker.close()
+                worker = None
+            self._idle_workers.put(worker)
+
+    def close(self) -> None:
+        for _ in range(self._num_workers):
+            worker = self._idle_workers.get()
+            if worker is not None:
+                worker.close()
+            self._idle_workers.put(None)
+
+
+# Common interface of the panel segmentation backends. The segment info is a dict with
+# at least a "panels" list of [x, y, w, h] boxes in srce image pixels. If there is a
+# cache, results are looked up there first, keyed by the image content and the
+# segmenter id and parameters.
+class PanelSegmenter(ABC):
+    def __init__(self, cache: Optional[PanelSegmentsCache] = None):
+        self._cache = cache
+
+    @abstractmethod
+    def get_segmenter_id(self) -> str:
+        pass
+
+    def get_segmenter_params(self) -> Dict[str, Any]:
+        return {}
+
+    def get_panels_segment_info(
+        self, srce_image: Optional[Image.Image], srce_filename: str
+    ) -> Dict[str, Any]:
+        if self._cache is None:
+            return self._segment_page(srce_image, srce_filename)
+
+        key = get_panel_segments_key(
+            self._get_key_image(srce_image, srce_filename),
+            srce_filename,
+            self.get_segmenter_id(),
+            self.get_segmenter_params(),
+        )
+        segment_info = self._cache.get(key)
+        if segment_info is not None:
+            logging.debug(f'Using cached segment info for "{get_abbrev_path(srce_filename)}".')
+            return segment_info
+
+        segment_info = self._segment_page(srce_image, srce_filename)
+        self._cache.put(key, segment_info)
+
+        return segment_info
+
+    @abstractmethod
+    def _segment_page(
+        self, srce_image: Optional[Image.Image], srce_filename: str
+    ) -> Dict[str, Any]:
+        pass
+
+    # Hashing the file is cheaper than hashing the decoded pixels.
+    @staticmethod
+    def _get_key_image(
+        srce_image: Optional[Image.Image], srce_filename: str
+    ) -> Optional[Image.Image]:
+        if srce_image is None or getattr(srce_image, "filename", "") == srce_filename:
+            return None
+        return srce_image
+
+
+class KumikoPanelSegmentation(PanelSegmenter):
+    def __init__(
+        self,
+        work_dir: str,
+        worker_pool: Optional[KumikoWorkerPool] = None,
+        cache: Optional[PanelSegmentsCache] = None,
+    ):
+        super().__init__(cache)
         self.__work_dir = work_dir
+        self.__worker_pool = worker_pool
+
+    def get_segmenter_id(self) -> str:
+        return KUMIKO_SEGMENTER_ID
 
-    def get_panels_segment_info(self, srce_image: Image, srce_filename: str) -> Dict[str, Any]:
+    # If 'srce_image' is None, or was opened straight from 'srce_filename', kumiko reads
+    # 'srce_filename' itself. Otherwise, the pixels (of 'srce_filename' if kumiko can't
+    # read its format) are handed over as an uncompressed ppm in shared memory (or the
+    # work dir), which is quick to write and read back.
+    def _segment_page(
+        self, srce_image: Optional[Image.Image], srce_filename: str
+    ) -> Dict[str, Any]:
         logging.debug(
             f'Getting panel bounding box for "{get_abbrev_path(srce_filename)}" using kumiko.'
         )
 
-        work_filename = str(
-            os.path.join(
-                self.__work_dir,
-                os.path.splitext(os.path.basename(srce_filename))[0] + "_orig.jpg",
-            )
+        if self.__is_srce_file_usable(srce_image, srce_filename):
+            return self.__get_segment_info(srce_filename)
+
+        if srce_image is None:
+            srce_image = self.__open_srce_image(srce_filename)
+
+        work_filename = self.__get_work_filename(srce_filename)
+        try:
+            if srce_image.mode not in ["L", "RGB"]:
+                srce_image = srce_image.convert("RGB")
+            srce_image.save(work_filename, format="PPM")
+            logging.debug(f'Saved srce image to work file "{work_filename}".')
+
+            return self.__get_segment_info(work_filename)
+        finally:
+            if os.path.exists(work_filename):
+                os.remove(work_filename)
+
+    @staticmethod
+    def __is_srce_file_usable(srce_image: Optional[Image.Image], srce_filename: str) -> bool:
+        if os.path.splitext(srce_filename)[1] not in KUMIKO_IMAGE_FILE_EXTS:
+            return False
+        if not os.path.isfile(srce_filename):
+            return False
+
+        return srce_image is None or getattr(srce_image, "filename", "") == srce_filename
+
+    # For a file kumiko can't read itself.
+    @staticmethod
+    def __open_srce_image(srce_filename: str) -> Image.Image:
+        if not os.path.isfile(srce_filename):
+            raise Exception(f'Could not find srce image "{get_abbrev_path(srce_filename)}".')
+        try:
+            return Image.open(srce_filename)
+        except OSError as e:
+            raise Exception(f'Could not read srce image "{get_abbrev_path(srce_filename)}": {e}')
+
+    def __get_work_filename(self, srce_filename: str) -> str:
+        work_dir = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else self.__work_dir
+        srce_stem = os.path.splitext(os.path.basename(srce_filename))[0]
+
+        fd, work_filename = tempfile.mkstemp(
+            suffix="_orig.ppm", prefix=srce_stem + "_", dir=work_dir
         )
-        srce_image.save(work_filename, optimize=True, compress_level=9)
-        logging.debug(f'Saved srce image to work file "{work_filename}".')
+        os.close(fd)
 
-        logging.debug(f'Getting segment info for "{work_filename}".')
-        segment_info = self.__run_kumiko(work_filename)
+        return work_filename
 
-        return segment_info
+    def __get_segment_info(self, page_filename: str) -> Dict[str, Any]:
+        logging.debug(f'Getting segment info for "{page_filename}".')
+        if self.__worker_pool is not None:
+            return self.__worker_pool.get_segment_info(page_filename)
+
+        return self.__run_kumiko(page_filename)
 
     @staticmethod
     def __run_kumiko(page_filename: str) -> Dict[str, Any]:
-        kumiko_home_dir = os.path.join(str(Path.home()), "Prj/github/kumiko")
-        kumiko_python_path = os.path.join(kumiko_home_dir, ".venv/bin/python3")
-        kumiko_script_path = os.path.join(kumiko_home_dir, "kumiko")
-        run_args = [kumiko_python_path, kumiko_script_path, "-i", page_filename]
+        run_args = [KUMIKO_PYTHON_PATH, KUMIKO_SCRIPT_PATH, "-i", page_filename]
         logging.debug(f"Running kumiko: {' '.join(run_args)}.")
         result = subprocess.run(
             run_args,
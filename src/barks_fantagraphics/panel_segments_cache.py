@@ -0,0 +1,75 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from .comics_utils import write_json_file
+
+PANEL_SEGMENTS_CACHE_FORMAT_VERSION = 1
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# Content-addressed store of panel segmentation results. The key is a hash of the
+# input image (the file bytes, or the pixels for an in-memory image) together with
+# the segmenter id and parameters, so a result is reused only for exactly the same
+# input and segmenter, no matter where the page file lives or when it was written.
+class PanelSegmentsCache:
+    def __init__(self, cache_dir: str):
+        self._cache_dir = cache_dir
+
+    def get_cache_dir(self) -> str:
+        return self._cache_dir
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        cache_file = self._get_cache_file(key)
+        if not os.path.isfile(cache_file):
+            return None
+
+        try:
+            with open(cache_file, "r") as f:
+                cached = json.load(f)
+            if cached["format_version"] != PANEL_SEGMENTS_CACHE_FORMAT_VERSION:
+                return None
+            return cached["segment_info"]
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f'Could not load panel segments cache file "{cache_file}": {e}')
+            return None
+
+    def put(self, key: str, segment_info: Dict[str, Any]) -> None:
+        cache_file = self._get_cache_file(key)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+
+        write_json_file(
+            cache_file,
+            {
+                "format_version": PANEL_SEGMENTS_CACHE_FORMAT_VERSION,
+                "segment_info": segment_info,
+            },
+        )
+
+    def _get_cache_file(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key[:2], key + ".json")
+
+
+def get_panel_segments_key(
+    srce_image: Optional[Image.Image],
+    srce_filename: str,
+    segmenter_id: str,
+    segmenter_params: Dict[str, Any],
+) -> str:
+    key_hash = hashlib.sha256()
+    key_hash.update(segmenter_id.encode("utf-8") + b"\0")
+    key_hash.update(json.dumps(segmenter_params, sort_keys=True).encode("utf-8") + b"\0")
+
+    if srce_image is None:
+        with open(srce_filename, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                key_hash.update(block)
+    else:
+        key_hash.update(f"{srce_image.mode}:{srce_image.size}\0".encode("utf-8"))
+        key_hash.update(srce_image.tobytes())
+
+    return key_hash.hexdigest()
@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import struct
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .comics_database import ComicsDatabase
+from .comics_info import JSON_FILE_EXT
+from .comics_utils import get_abbrev_path, write_json_file
+
+PANEL_SEGMENTS_STORE_FORMAT_VERSION = 1
+PANEL_SEGMENTS_STORE_FILENAME = "panel-segments-store.bin"
+PANEL_SEGMENTS_STORE_MAGIC = b"BARKSPS1"
+PANEL_SEGMENTS_STORE_ALIGNMENT = 16
+
+
+# All the panel boxes of a set of pages: 'boxes' is an (N, 4) int32 array of
+# [x, y, w, h] rows and the boxes of page i are 'boxes[page_starts[i]:page_starts[i+1]]'.
+@dataclass
+class PanelBoxes:
+    boxes: np.ndarray
+    page_starts: np.ndarray
+
+
+@dataclass
+class StoredPage:
+    start: int
+    num_panels: int
+    # Stamp of the json file the page was packed from.
+    mtime_ns: int
+    size: int
+    # Everything in the json apart from the panels.
+    info: Dict[str, Any]
+
+
+# One volume's panel segments packed into a single file:
+#
+#   magic (8 bytes) | header length (uint64 LE) | header json | padding | boxes
+#
+# The header json holds the page index (page name -> start, number of panels, json
+# file stamp, other segment info) and the boxes are a contiguous little-endian int32
+# (N, 4) array of [x, y, w, h] rows, which is memory mapped rather than read.
+class PanelSegmentsStore:
+    def __init__(self, store_file: str):
+        self._store_file = store_file
+
+        with open(store_file, "rb") as f:
+            if f.read(len(PANEL_SEGMENTS_STORE_MAGIC)) != PANEL_SEGMENTS_STORE_MAGIC:
+                raise Exception(f'Not a panel segments store: "{store_file}".')
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+
+        if header["format_version"] != PANEL_SEGMENTS_STORE_FORMAT_VERSION:
+            raise Exception(f'Unexpected panel segments store version: "{store_file}".')
+
+        self._pages = {
+            name: StoredPage(start, num_panels, mtime_ns, size, info)
+            for name, (start, num_panels, mtime_ns, size, info) in header["pages"].items()
+        }
+        num_boxes = header["num_boxes"]
+        if num_boxes == 0:
+            self._boxes = np.zeros((0, 4), dtype=np.int32)
+        else:
+            self._boxes = np.memmap(
+                store_file,
+                dtype="<i4",
+                mode="r",
+                offset=_get_boxes_offset(header_len),
+                shape=(num_boxes, 4),
+            )
+
+    def get_store_file(self) -> str:
+        return self._store_file
+
+    def get_page_names(self) -> List[str]:
+        return sorted(self._pages)
+
+    def get_page(self, page_name: str) -> Optional[StoredPage]:
+        return self._pages.get(page_name)
+
+    def get_panels(self, page_name: str) -> np.ndarray:
+        page = self._pages[page_name]
+        return self._boxes[page.start : page.start + page.num_panels]
+
+    # Same as the page's json contents.
+    def get_segment_info(self, page_name: str) -> Dict[str, Any]:
+        return {
+            **self._pages[page_name].info,
+            "panels": self.get_panels(page_name).tolist(),
+        }
+
+    # True if the page is in the store and its json file, if still there, is unchanged.
+    def is_current(self, page_name: str, segments_file: str) -> bool:
+        page = self._pages.get(page_name)
+        if page is None:
+            return False
+        try:
+            stat = os.stat(segments_file)
+        except FileNotFoundError:
+            return True
+
+        return stat.st_mtime_ns == page.mtime_ns and stat.st_size == page.size
+
+
+def get_panel_segments_store_file(segments_dir: str) -> str:
+    return os.path.join(segments_dir, PANEL_SEGMENTS_STORE_FILENAME)
+
+
+def get_volume_panel_segments_store_file(comics_database: ComicsDatabase, volume_num: int) -> str:
+    return get_panel_segments_store_file(
+        comics_database.get_fantagraphics_panel_segments_volume_dir(volume_num)
+    )
+
+
+def build_volume_panel_segments_store(
+    comics_database: ComicsDatabase, volume_num: int
+) -> PanelSegmentsStore:
+    return build_panel_segments_store(
+        comics_database.get_fantagraphics_panel_segments_volume_dir(volume_num)
+    )
+
+
+# Packs all the page json files in 'segments_dir' into the dir's store file.
+def build_panel_segments_store(segments_dir: str) -> PanelSegmentsStore:
+    with os.scandir(segments_dir) as entries:
+        segments_files = sorted(
+            entry.path
+            for entry in entries
+            if entry.is_file() and entry.name.endswith(JSON_FILE_EXT)
+        )
+
+    pages: Dict[str, List[Any]] = {}
+    all_panels: List[List[int]] = []
+    for segments_file in segments_files:
+        stat = os.stat(segments_file)
+        with open(segments_file, "r") as f:
+            segment_info = json.load(f)
+        panels = segment_info.pop("panels")
+
+        page_name = _get_page_name(segments_file)
+        pages[page_name] = [
+            len(all_panels),
+            len(panels),
+            stat.st_mtime_ns,
+            stat.st_size,
+            segment_info,
+        ]
+        all_panels.extend(panels)
+
+    header = {
+        "format_version": PANEL_SEGMENTS_STORE_FORMAT_VERSION,
+        "num_boxes": len(all_panels),
+        "pages": pages,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    boxes = np.array(all_panels, dtype="<i4").reshape(-1, 4)
+
+    store_file = get_panel_segments_store_file(segments_dir)
+    temp_file = store_file + ".tmp"
+    with open(temp_file, "wb") as f:
+        f.write(PANEL_SEGMENTS_STORE_MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (_get_boxes_offset(len(header_bytes)) - f.tell()))
+        f.write(boxes.tobytes())
+    os.replace(temp_file, store_file)
+    with _open_stores_lock:
+        _open_stores.pop(segments_dir, None)
+
+    logging.debug(
+        f"Packed {len(pages)} pages, {len(all_panels)} panels into"
+        f' "{get_abbrev_path(store_file)}".'
+    )
+
+    return PanelSegmentsStore(store_file)
+
+
+# Writes the store's pages back out as the usual one json file per page.
+def export_panel_segments_store(store: PanelSegmentsStore, segments_dir: str) -> None:
+    os.makedirs(segments_dir, exist_ok=True)
+    for page_name in store.get_page_names():
+        segments_file = os.path.join(segments_dir, page_name + JSON_FILE_EXT)
+        write_json_file(segments_file, store.get_segment_info(page_name))
+
+
+def get_panel_segments_store(segments_dir: str) -> Optional[PanelSegmentsStore]:
+    store_file = get_panel_segments_store_file(segments_dir)
+    if not os.path.isfile(store_file):
+        return None
+
+    try:
+        return PanelSegmentsStore(store_file)
+    except Exception as e:
+        logging.warning(f'Could not open panel segments store "{store_file}": {e}')
+        return None
+
+
+# Open stores by segments dir, with the (mtime_ns, size) of the store file when it was
+# opened, or None if there was no store file.
+_open_stores: Dict[str, Tuple[Optional[Tuple[int, int]], Optional[PanelSegmentsStore]]] = {}
+_open_stores_lock = threading.Lock()
+
+
+# Like 'get_panel_segments_store', but the store is kept open and reused for as long as
+# the store file is unchanged.
+def get_open_panel_segments_store(segments_dir: str) -> Optional[PanelSegmentsStore]:
+    store_file = get_panel_segments_store_file(segments_dir)
+    try:
+        stat = os.stat(store_file)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        stamp = None
+
+    with _open_stores_lock:
+        open_store = _open_stores.get(segments_dir)
+    if open_store is not None and open_store[0] == stamp:
+        return open_store[1]
+
+    store = None if stamp is None else get_panel_segments_store(segments_dir)
+    with _open_stores_lock:
+        _open_stores[segments_dir] = (stamp, store)
+
+    return store
+
+
+# Drop-in for reading a page's segments json: uses the dir's store if the page in it
+# is current, otherwise the json file. Unless 'stores' is given, the open stores are
+# shared with other calls.
+def get_panels_segment_info(
+    segments_file: str, stores: Optional[Dict[str, Optional[PanelSegmentsStore]]] = None
+) -> Dict[str, Any]:
+    store = _get_store_for_file(segments_file, stores)
+    page_name = _get_page_name(segments_file)
+    if store is not None and store.is_current(page_name, segments_file):
+        return store.get_segment_info(page_name)
+
+    with open(segments_file, "r") as f:
+        return json.load(f)
+
+
+# Loads the panel boxes of many pages, taking them from the stores where they are
+# current and only parsing the json of pages that aren't.
+def load_panel_boxes(segments_files: List[str]) -> PanelBoxes:
+    page_boxes = []
+    for segments_file in segments_files:
+        store = _get_store_for_file(segments_file)
+        page_name = _get_page_name(segments_file)
+        if store is not None and store.is_current(page_name, segments_file):
+            boxes = store.get_panels(page_name)
+        else:
+            with open(segments_file, "r") as f:
+                boxes = np.array(json.load(f)["panels"], dtype=np.int32).reshape(-1, 4)
+        if len(boxes) == 0:
+            raise Exception(f'No panels in segments file "{get_abbrev_path(segments_file)}".')
+        page_boxes.append(boxes)
+
+    page_lens = np.array([len(boxes) for boxes in page_boxes], dtype=np.int64)
+    page_starts = np.concatenate([[0], np.cumsum(page_lens)[:-1]]).astype(np.int64)
+
+    return PanelBoxes(np.concatenate(page_boxes).astype(np.int32), page_starts)
+
+
+def _get_store_for_file(
+    segments_file: str, stores: Optional[Dict[str, Optional[PanelSegmentsStore]]] = None
+) -> Optional[PanelSegmentsStore]:
+    segments_dir = os.path.dirname(segments_file)
+    if stores is None:
+        return get_open_panel_segments_store(segments_dir)
+    if segments_dir not in stores:
+        stores[segments_dir] = get_panel_segments_store(segments_dir)
+    return stores[segments_dir]
+
+
+def _get_page_name(segments_file: str) -> str:
+    return os.path.splitext(os.path.basename(segments_file))[0]
+
+
+def _get_boxes_offset(header_len: int) -> int:
+    offset = len(PANEL_SEGMENTS_STORE_MAGIC) + 8 + header_len
+    return -(-offset // PANEL_SEGMENTS_STORE_ALIGNMENT) * PANEL_SEGMENTS_STORE_ALIGNMENT
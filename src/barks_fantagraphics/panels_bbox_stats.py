@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .comic_book import ComicBook, RequiredDimensions
+from .comics_consts import CATALOG_CACHE_SUBDIR, PageType
+from .comics_database import ComicsDatabase
+from .comics_utils import get_abbrev_path, write_json_file
+from .panel_segments_store import PanelBoxes, load_panel_boxes
+
+PANELS_BBOX_STATS_FORMAT_VERSION = 1
+PANELS_BBOX_STATS_FILENAME = "panels-bbox-stats.json"
+DEFAULT_PANELS_BBOX_PAGE_TYPES = [PageType.BODY]
+
+
+@dataclass
+class PanelsBBoxStats:
+    min_width: int
+    max_width: int
+    min_height: int
+    max_height: int
+    av_width: int
+    av_height: int
+
+
+# Same values as 'get_min_max_panel_values' for every page at once: an (P, 4) array of
+# [x_min, y_min, x_max, y_max] rows.
+def get_page_bboxes(panel_boxes: PanelBoxes) -> np.ndarray:
+    boxes = panel_boxes.boxes
+    starts = panel_boxes.page_starts
+    x0 = boxes[:, 0]
+    y0 = boxes[:, 1]
+    x1 = x0 + (boxes[:, 2] - 1)
+    y1 = y0 + (boxes[:, 3] - 1)
+
+    return np.stack(
+        [
+            np.minimum.reduceat(x0, starts),
+            np.minimum.reduceat(y0, starts),
+            np.maximum.reduceat(x1, starts),
+            np.maximum.reduceat(y1, starts),
+        ],
+        axis=1,
+    )
+
+
+# Stats for consecutive groups of pages (stories) starting at 'story_page_starts'.
+def get_panels_bbox_stats(
+    page_bboxes: np.ndarray, story_page_starts: np.ndarray
+) -> List[PanelsBBoxStats]:
+    widths = (page_bboxes[:, 2] - page_bboxes[:, 0] + 1).astype(np.int64)
+    heights = (page_bboxes[:, 3] - page_bboxes[:, 1] + 1).astype(np.int64)
+    num_pages = np.diff(np.append(story_page_starts, len(page_bboxes)))
+
+    min_widths = np.minimum.reduceat(widths, story_page_starts)
+    max_widths = np.maximum.reduceat(widths, story_page_starts)
+    min_heights = np.minimum.reduceat(heights, story_page_starts)
+    max_heights = np.maximum.reduceat(heights, story_page_starts)
+    av_widths = np.rint(np.add.reduceat(widths, story_page_starts) / num_pages)
+    av_heights = np.rint(np.add.reduceat(heights, story_page_starts) / num_pages)
+
+    return [
+        PanelsBBoxStats(*(int(v) for v in values))
+        for values in zip(min_widths, max_widths, min_heights, max_heights, av_widths, av_heights)
+    ]
+
+
+# A copy of 'comic' with the stats filled in.
+def get_comic_book_with_panels_bbox_stats(comic: ComicBook, stats: PanelsBBoxStats) -> ComicBook:
+    return replace(
+        comic,
+        srce_min_panels_bbox_width=stats.min_width,
+        srce_max_panels_bbox_width=stats.max_width,
+        srce_min_panels_bbox_height=stats.min_height,
+        srce_max_panels_bbox_height=stats.max_height,
+        srce_av_panels_bbox_width=stats.av_width,
+        srce_av_panels_bbox_height=stats.av_height,
+        # Every page's panels must fit.
+        required_dim=RequiredDimensions(
+            panels_bbox_width=stats.max_width,
+            panels_bbox_height=stats.max_height,
+            page_num_y_bottom=comic.required_dim.page_num_y_bottom,
+        ),
+    )
+
+
+def get_story_key(comic: ComicBook) -> str:
+    return os.path.splitext(os.path.basename(comic.ini_file))[0]
+
+
+def get_panels_bbox_stats_file(database_dir: str) -> str:
+    return os.path.join(database_dir, CATALOG_CACHE_SUBDIR, PANELS_BBOX_STATS_FILENAME)
+
+
+# Works out the panels bounding box stats of stories from their panel segments files
+# and gives copies of ComicBooks with the corresponding fields filled in. Stats are
+# cached per story in a json file, together with the mtimes of the segments files they
+# came from, so only stories with new or changed segments files are recomputed. A
+# volume's stories are loaded (from the volume's packed segments store where it is
+# current) and computed together in one set of arrays.
+class PanelsBBoxStatsEngine:
+    def __init__(
+        self,
+        comics_database: ComicsDatabase,
+        page_types: Optional[List[PageType]] = None,
+    ):
+        self._comics_database = comics_database
+        self._page_types = DEFAULT_PANELS_BBOX_PAGE_TYPES if page_types is None else page_types
+        self._stats_file = get_panels_bbox_stats_file(comics_database.get_comics_database_dir())
+        self._cache = self._load_cache()
+
+    def get_comic_book(self, title: str) -> ComicBook:
+        return self.get_comic_books_with_stats([self._comics_database.get_comic_book(title)])[0]
+
+    def get_story_stats(self, comic: ComicBook) -> PanelsBBoxStats:
+        return self.get_stories_stats([comic])[get_story_key(comic)]
+
+    def get_volume_stats(self, volume_nums: List[int]) -> Dict[str, PanelsBBoxStats]:
+        titles = self._comics_database.get_all_story_titles_in_fantagraphics_volume(volume_nums)
+        return self.get_stories_stats(self._comics_database.get_comic_books(titles))
+
+    def get_comic_books_with_stats(self, comics: List[ComicBook]) -> List[ComicBook]:
+        all_stats = self.get_stories_stats(comics)
+        return [
+            get_comic_book_with_panels_bbox_stats(comic, all_stats[get_story_key(comic)])
+            for comic in comics
+        ]
+
+    def get_stories_stats(self, comics: List[ComicBook]) -> Dict[str, PanelsBBoxStats]:
+        all_stats: Dict[str, PanelsBBoxStats] = {}
+        stale: List[Tuple[str, List[str], Dict[str, int]]] = []
+        for comic in comics:
+            title = get_story_key(comic)
+            segments_files = comic.get_srce_panel_segments_files(self._page_types)
+            if not segments_files:
+                raise Exception(f'No pages with panels in "{get_abbrev_path(comic.ini_file)}".')
+            stamps = _get_segments_file_stamps(title, segments_files)
+            cached = self._cache.get(title)
+            if cached is not None and cached[0] == stamps:
+                all_stats[title] = cached[1]
+            else:
+                stale.append((title, segments_files, stamps))
+
+        if not stale:
+            return all_stats
+
+        logging.debug(f"Computing panels bbox stats for {len(stale)} stories.")
+        panel_boxes = self._load_panel_boxes([file for _, files, _ in stale for file in files])
+        story_lens = [len(files) for _, files, _ in stale]
+        story_page_starts = np.concatenate([[0], np.cumsum(story_lens)[:-1]]).astype(np.int64)
+        stale_stats = get_panels_bbox_stats(get_page_bboxes(panel_boxes), story_page_starts)
+
+        for (title, _, stamps), stats in zip(stale, stale_stats):
+            all_stats[title] = stats
+            self._cache[title] = (stamps, stats)
+        self._save_cache()
+
+        return all_stats
+
+    @staticmethod
+    def _load_panel_boxes(segments_files: List[str]) -> PanelBoxes:
+        return load_panel_boxes(segments_files)
+
+    def _load_cache(self) -> Dict[str, Tuple[Dict[str, int], PanelsBBoxStats]]:
+        if not os.path.isfile(self._stats_file):
+            return {}
+
+        try:
+            with open(self._stats_file, "r") as f:
+                stats_json = json.load(f)
+            if stats_json["format_version"] != PANELS_BBOX_STATS_FORMAT_VERSION:
+                return {}
+            if stats_json["page_types"] != [page_type.name for page_type in self._page_types]:
+                return {}
+            return {
+                title: (stamps, PanelsBBoxStats(**stats))
+                for title, (stamps, stats) in stats_json["stories"].items()
+            }
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f'Could not load panels bbox stats "{self._stats_file}": {e}')
+            return {}
+
+    def _save_cache(self) -> None:
+        stats_json = {
+            "format_version": PANELS_BBOX_STATS_FORMAT_VERSION,
+            "page_types": [page_type.name for page_type in self._page_types],
+            "stories": {
+                title: [stamps, asdict(stats)] for title, (stamps, stats) in self._cache.items()
+            },
+        }
+
+        os.makedirs(os.path.dirname(self._stats_file), exist_ok=True)
+        write_json_file(self._stats_file, stats_json)
+
+
+# Segments file -> mtime. Every missing file of the story is named in the error.
+def _get_segments_file_stamps(title: str, segments_files: List[str]) -> Dict[str, int]:
+    stamps = {}
+    missing_pages = []
+    for file in segments_files:
+        try:
+            stamps[file] = os.stat(file).st_mtime_ns
+        except FileNotFoundError:
+            missing_pages.append(os.path.splitext(os.path.basename(file))[0])
+
+    if missing_pages:
+        segments_dir = get_abbrev_path(os.path.dirname(segments_files[0]))
+        raise Exception(
+            f'Missing panel segments files for "{title}", pages {", ".join(missing_pages)},'
+            f' in "{segments_dir}".'
+        )
+
+    return stamps
@@ -0,0 +1,233 @@
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterator, Tuple
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_TEXT_CHUNK_TYPES = [b"tEXt", b"zTXt", b"iTXt"]
+PNG_MAX_KEYWORD_LEN = 79
+
+PNG_COLOR_TYPE_GRAY = 0
+PNG_COLOR_TYPE_RGB = 2
+PNG_COLOR_TYPE_GRAY_ALPHA = 4
+PNG_COLOR_TYPE_RGBA = 6
+PNG_CHANNELS = {
+    PNG_COLOR_TYPE_GRAY: 1,
+    PNG_COLOR_TYPE_RGB: 3,
+    PNG_COLOR_TYPE_GRAY_ALPHA: 2,
+    PNG_COLOR_TYPE_RGBA: 4,
+}
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+@dataclass
+class PngHeader:
+    width: int
+    height: int
+    bit_depth: int
+    color_type: int
+    interlace: int
+
+    def get_bytes_per_pixel(self) -> int:
+        return PNG_CHANNELS[self.color_type] * self.bit_depth // 8
+
+    def get_row_len(self) -> int:
+        # Filtered scanline length, including the leading filter type byte.
+        return 1 + self.width * self.get_bytes_per_pixel()
+
+
+# Adds or replaces text chunks in a png file without decoding or re-encoding any image
+# data. The file is streamed chunk by chunk into a temp file: existing text chunks
+# with the same keywords are dropped, the new chunks are inserted just before the
+# first IDAT chunk, and everything else (including the compressed image data) is
+# copied unchanged. The temp file then atomically replaces the original.
+def write_png_text_chunks(png_file: str, text: Dict[str, str]) -> None:
+    new_chunks = [_get_text_chunk(keyword, text[keyword]) for keyword in text]
+    replaced_keywords = set(text)
+
+    temp_file = png_file + ".tmp"
+    try:
+        with open(png_file, "rb") as srce, open(temp_file, "wb") as dest:
+            if srce.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                raise Exception(f'Not a png file: "{png_file}".')
+            dest.write(PNG_SIGNATURE)
+
+            inserted = False
+            while True:
+                header = srce.read(8)
+                if len(header) != 8:
+                    raise Exception(f'Unexpected end of png file: "{png_file}".')
+                length, chunk_type = struct.unpack(">I4s", header)
+
+                if chunk_type in PNG_TEXT_CHUNK_TYPES:
+                    data_and_crc = srce.read(length + 4)
+                    if get_text_chunk_keyword(data_and_crc[:length]) in replaced_keywords:
+                        continue
+                    dest.write(header + data_and_crc)
+                    continue
+
+                if not inserted and chunk_type in [b"IDAT", b"IEND"]:
+                    dest.write(b"".join(new_chunks))
+                    inserted = True
+
+                dest.write(header)
+                _copy_bytes(srce, dest, length + 4, png_file)
+
+                if chunk_type == b"IEND":
+                    break
+
+        os.replace(temp_file, png_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def get_png_header(png_file: str) -> PngHeader:
+    with open(png_file, "rb") as f:
+        return _read_png_header(f, png_file)
+
+
+# Yields the decompressed, still filtered, scanlines of an 8-bit non-interlaced png in
+# blocks of 'num_rows' rows (the last block may be shorter). Only one block of
+# decompressed data is held in memory at a time.
+def iter_png_filtered_rows(png_file: str, num_rows: int) -> Iterator[bytes]:
+    with open(png_file, "rb") as f:
+        header = _read_png_header(f, png_file)
+        block_len = header.get_row_len() * num_rows
+
+        decompressor = zlib.decompressobj()
+        pending = bytearray()
+        for idat_data in _iter_idat_data(f, png_file):
+            data = idat_data
+            while data:
+                pending += decompressor.decompress(data, block_len)
+                data = decompressor.unconsumed_tail
+                while len(pending) >= block_len:
+                    yield bytes(pending[:block_len])
+                    del pending[:block_len]
+
+        pending += decompressor.flush()
+        while pending:
+            yield bytes(pending[:block_len])
+            del pending[:block_len]
+
+
+def make_png(header: PngHeader, filtered_rows: bytes, compress_level: int = 0) -> bytes:
+    ihdr = struct.pack(
+        ">IIBBBBB", header.width, header.height, header.bit_depth, header.color_type, 0, 0, 0
+    )
+    return (
+        PNG_SIGNATURE
+        + get_png_chunk(b"IHDR", ihdr)
+        + get_png_chunk(b"IDAT", zlib.compress(filtered_rows, compress_level))
+        + get_png_chunk(b"IEND", b"")
+    )
+
+
+# Reads the text chunks before the image data from a bytes-like object, such as an
+# mmap of the file, without touching the IDAT chunks.
+def get_png_text(buffer, png_file: str = "") -> Dict[str, str]:
+    if buffer[: len(PNG_SIGNATURE)] != PNG_SIGNATURE:
+        raise Exception(f'Not a png file: "{png_file}".')
+
+    text = {}
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(buffer):
+        length, chunk_type = struct.unpack_from(">I4s", buffer, pos)
+        if chunk_type in [b"IDAT", b"IEND"]:
+            break
+        if chunk_type in PNG_TEXT_CHUNK_TYPES:
+            keyword, value = read_text_chunk(chunk_type, buffer[pos + 8 : pos + 8 + length])
+            text[keyword] = value
+        pos += length + 12
+
+    return text
+
+
+def get_png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+    )
+
+
+def get_text_chunk_keyword(chunk_data: bytes) -> str:
+    return chunk_data.split(b"\0", 1)[0].decode("latin-1")
+
+
+def read_text_chunk(chunk_type: bytes, chunk_data: bytes) -> Tuple[str, str]:
+    keyword, value = chunk_data.split(b"\0", 1)
+
+    if chunk_type == b"tEXt":
+        return keyword.decode("latin-1"), value.decode("latin-1")
+
+    if chunk_type == b"zTXt":
+        return keyword.decode("latin-1"), zlib.decompress(value[1:]).decode("latin-1")
+
+    # iTXt: compression flag, compression method, language tag, translated keyword, text.
+    compressed = value[0] == 1
+    _lang, _translated_keyword, text = value[2:].split(b"\0", 2)
+    if compressed:
+        text = zlib.decompress(text)
+    return keyword.decode("latin-1"), text.decode("utf-8")
+
+
+# Same choice of chunk type as Pillow's 'PngInfo.add_text': tEXt when the value is
+# latin-1 encodable, otherwise an uncompressed iTXt.
+def _get_text_chunk(keyword: str, value: str) -> bytes:
+    keyword_bytes = keyword.encode("latin-1")
+    if not 1 <= len(keyword_bytes) <= PNG_MAX_KEYWORD_LEN:
+        raise Exception(f'Invalid png text keyword: "{keyword}".')
+
+    try:
+        return get_png_chunk(b"tEXt", keyword_bytes + b"\0" + value.encode("latin-1"))
+    except UnicodeEncodeError:
+        return get_png_chunk(b"iTXt", keyword_bytes + b"\0\0\0\0\0" + value.encode("utf-8"))
+
+
+def _read_png_header(f: BinaryIO, png_file: str) -> PngHeader:
+    if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        raise Exception(f'Not a png file: "{png_file}".')
+
+    length, chunk_type = struct.unpack(">I4s", f.read(8))
+    if chunk_type != b"IHDR" or length != 13:
+        raise Exception(f'Expected IHDR chunk at start of png file: "{png_file}".')
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", f.read(13))
+    f.read(4)
+
+    return PngHeader(width, height, bit_depth, color_type, interlace)
+
+
+def _iter_idat_data(f: BinaryIO, png_file: str) -> Iterator[bytes]:
+    while True:
+        header = f.read(8)
+        if len(header) != 8:
+            raise Exception(f'Unexpected end of png file: "{png_file}".')
+        length, chunk_type = struct.unpack(">I4s", header)
+
+        if chunk_type == b"IEND":
+            break
+        if chunk_type != b"IDAT":
+            f.seek(length + 4, os.SEEK_CUR)
+            continue
+
+        while length > 0:
+            data = f.read(min(length, COPY_BUFFER_SIZE))
+            if not data:
+                raise Exception(f'Unexpected end of png file: "{png_file}".')
+            length -= len(data)
+            yield data
+        f.read(4)
+
+
+def _copy_bytes(srce: BinaryIO, dest: BinaryIO, num_bytes: int, png_file: str) -> None:
+    while num_bytes > 0:
+        buffer = srce.read(min(num_bytes, COPY_BUFFER_SIZE))
+        if not buffer:
+            raise Exception(f'Unexpected end of png file: "{png_file}".')
+        dest.write(buffer)
+        num_bytes -= len(buffer)
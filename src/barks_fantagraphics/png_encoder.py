@@ -0,0 +1,168 @@
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional, Tuple
+
+import numpy as np
+
+from .png_chunks import (
+    PNG_COLOR_TYPE_GRAY,
+    PNG_COLOR_TYPE_GRAY_ALPHA,
+    PNG_COLOR_TYPE_RGB,
+    PNG_COLOR_TYPE_RGBA,
+    PNG_SIGNATURE,
+    get_png_chunk,
+)
+
+PNG_COLOR_TYPES = {
+    1: PNG_COLOR_TYPE_GRAY,
+    2: PNG_COLOR_TYPE_GRAY_ALPHA,
+    3: PNG_COLOR_TYPE_RGB,
+    4: PNG_COLOR_TYPE_RGBA,
+}
+
+# Filtered bytes deflated by each task.
+PNG_ENCODE_PART_SIZE = 2 * 1024 * 1024
+PNG_IDAT_CHUNK_SIZE = 1024 * 1024
+DEFLATE_WINDOW_SIZE = 32 * 1024
+ADLER32_BASE = 65521
+
+
+# Encodes a png pigz-style: the filtered scanlines are split into parts which are
+# filtered and deflated in parallel as raw deflate streams. Each part is primed with
+# the last 32K of the part before it as a preset dictionary, so matches across part
+# boundaries are still found, and every part but the last ends with a sync flush so
+# the parts concatenate into one valid deflate stream. The zlib header and the
+# combined adler32 of the parts then wrap that stream into the IDAT data.
+#
+# The row filters are chosen per row with the usual minimum sum of absolute
+# differences heuristic.
+def write_png_parallel(
+    png_file: str,
+    pixels: np.ndarray,
+    compress_level: int = 6,
+    max_workers: Optional[int] = None,
+) -> None:
+    if pixels.dtype != np.uint8:
+        raise Exception(f"Expected 8-bit pixels for png, not {pixels.dtype}.")
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, np.newaxis]
+    height, width, num_channels = pixels.shape
+    if num_channels not in PNG_COLOR_TYPES:
+        raise Exception(f"Unexpected number of channels for png: {num_channels}.")
+
+    pixels = np.ascontiguousarray(pixels).reshape(height, width * num_channels)
+    row_len = width * num_channels + 1
+    rows_per_part = max(1, PNG_ENCODE_PART_SIZE // row_len)
+    part_starts = list(range(0, height, rows_per_part))
+
+    def deflate_part(start: int) -> Tuple[bytes, int, int]:
+        stop = min(start + rows_per_part, height)
+        return _deflate_part(pixels, start, stop, num_channels, stop == height, compress_level)
+
+    with open(png_file, "wb") as f:
+        f.write(PNG_SIGNATURE)
+        ihdr = struct.pack(">IIBBBBB", width, height, 8, PNG_COLOR_TYPES[num_channels], 0, 0, 0)
+        f.write(get_png_chunk(b"IHDR", ihdr))
+
+        adler = 1
+        pending = _get_zlib_header(compress_level)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for deflated, part_adler, part_len in executor.map(deflate_part, part_starts):
+                adler = _adler32_combine(adler, part_adler, part_len)
+                pending = _write_idat_chunks(f, pending + deflated)
+        _write_idat_chunks(f, pending + struct.pack(">I", adler), flush=True)
+
+        f.write(get_png_chunk(b"IEND", b""))
+
+
+def _deflate_part(
+    pixels: np.ndarray, start: int, stop: int, bpp: int, is_last: bool, compress_level: int
+) -> Tuple[bytes, int, int]:
+    # Re-filter enough of the rows before this part to make up the dictionary. Filtering
+    # a row only depends on the row and the one above, so these match what the
+    # previous part produced.
+    row_len = pixels.shape[1] + 1
+    dict_start = max(0, start - (DEFLATE_WINDOW_SIZE + row_len - 1) // row_len)
+    filtered = _filter_rows(pixels, dict_start, stop, bpp)
+    dict_len = (start - dict_start) * row_len
+    zdict = filtered[max(0, dict_len - DEFLATE_WINDOW_SIZE) : dict_len]
+    data = filtered[dict_len:]
+
+    if zdict:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15, 9, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15, 9)
+    deflated = compressor.compress(data) + compressor.flush(
+        zlib.Z_FINISH if is_last else zlib.Z_SYNC_FLUSH
+    )
+
+    return deflated, zlib.adler32(data), len(data)
+
+
+def _filter_rows(pixels: np.ndarray, start: int, stop: int, bpp: int) -> bytes:
+    rows = pixels[start:stop]
+    if start == 0:
+        above = np.vstack([np.zeros_like(pixels[:1]), pixels[: stop - 1]])
+    else:
+        above = pixels[start - 1 : stop - 1]
+
+    x = rows.astype(np.int16)
+    a = np.zeros_like(x)
+    a[:, bpp:] = x[:, :-bpp]
+    b = above.astype(np.int16)
+    c = np.zeros_like(b)
+    c[:, bpp:] = b[:, :-bpp]
+
+    pa = np.abs(b - c)
+    pb = np.abs(a - c)
+    pc = np.abs(a + b - 2 * c)
+    paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+
+    # Filter types: none, sub, up, average, paeth.
+    candidates = np.stack([x, x - a, x - b, x - ((a + b) >> 1), x - paeth]).astype(np.uint8)
+    scores = np.minimum(candidates, 256 - candidates.astype(np.int16)).sum(axis=2)
+    filter_types = np.argmin(scores, axis=0)
+
+    filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = filter_types
+    filtered[:, 1:] = candidates[filter_types, np.arange(rows.shape[0])]
+
+    return filtered.tobytes()
+
+
+def _get_zlib_header(compress_level: int) -> bytes:
+    cmf = 0x78  # deflate with a 32K window
+    if compress_level < 2:
+        flevel = 0
+    elif compress_level < 6:
+        flevel = 1
+    elif compress_level == 6:
+        flevel = 2
+    else:
+        flevel = 3
+    flg = flevel << 6
+    flg += 31 - (cmf * 256 + flg) % 31
+
+    return bytes([cmf, flg])
+
+
+# Same as zlib's 'adler32_combine', which isn't exposed by the python module.
+def _adler32_combine(adler1: int, adler2: int, len2: int) -> int:
+    rem = len2 % ADLER32_BASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = (rem * sum1) % ADLER32_BASE
+    sum1 += (adler2 & 0xFFFF) + ADLER32_BASE - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + ADLER32_BASE - rem
+
+    return (sum1 % ADLER32_BASE) | ((sum2 % ADLER32_BASE) << 16)
+
+
+# Writes full IDAT chunks and returns any leftover data.
+def _write_idat_chunks(f: BinaryIO, data: bytes, flush: bool = False) -> bytes:
+    pos = 0
+    while len(data) - pos >= PNG_IDAT_CHUNK_SIZE or (flush and pos < len(data)):
+        f.write(get_png_chunk(b"IDAT", data[pos : pos + PNG_IDAT_CHUNK_SIZE]))
+        pos += PNG_IDAT_CHUNK_SIZE
+
+    return data[pos:]
@@ -0,0 +1,91 @@
+import logging
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List, Tuple
+
+from .comics_consts import PageType
+from .comics_utils import get_abbrev_path
+
+
+class ResolutionEventType(Enum):
+    FIXES = "Using fixes srce file"
+    ADDED = "Using added srce file"
+    SPECIAL_CASE_FIXES = "Special case - using fixes srce file"
+    SPECIAL_CASE_ADDED_FIXES = "Special case - using ADDED fixes srce file"
+    UPSCAYLED_FIXES = "Using upscayled fixes srce file"
+    ADDED_UPSCAYLED = "Using added srce upscayled file"
+    RESTORED_FIXES = "Using restored fixes srce file"
+    ADDED_RESTORED = "Using added srce restored file"
+    SPECIAL_CASE_RESTORED_FIXES = "Special case - using restored fixes srce file"
+    SPECIAL_CASE_ADDED_RESTORED_FIXES = "Special case - using ADDED restored fixes srce file"
+
+
+@dataclass
+class ResolutionEvent:
+    event_type: ResolutionEventType
+    page_num: str
+    page_type: PageType
+    file: str
+
+
+# Collects the notable outcomes of page resolution (fixes used, added pages, special
+# cases). Recording an event is just a dict store. The first time an event is recorded
+# it is also logged as a "NOTE" at 'log_level', with the path only formatted if that
+# level is enabled. Resolving the same page again neither adds nor logs a duplicate.
+class ResolutionEvents:
+    def __init__(self, log_level: int = logging.INFO):
+        self._events: Dict[Tuple[ResolutionEventType, str], Tuple[str, PageType]] = {}
+        self._log_level = log_level
+
+    def record(
+        self, event_type: ResolutionEventType, page_num: str, page_type: PageType, file: str
+    ) -> None:
+        key = (event_type, file)
+        if key in self._events:
+            return
+        self._events[key] = (page_num, page_type)
+
+        if logging.getLogger().isEnabledFor(self._log_level):
+            logging.log(
+                self._log_level,
+                f"NOTE: {event_type.value} for {page_type.name} page:"
+                f' "{get_abbrev_path(file)}".',
+            )
+
+    def get_events(self) -> List[ResolutionEvent]:
+        return [
+            ResolutionEvent(event_type, page_num, page_type, file)
+            for (event_type, file), (page_num, page_type) in self._events.items()
+        ]
+
+    def get_num_events(self, event_type: ResolutionEventType) -> int:
+        return sum(1 for (e_type, _) in self._events if e_type == event_type)
+
+    def clear(self) -> None:
+        self._events.clear()
+
+    def get_summary_report(self) -> str:
+        events_by_type: Dict[ResolutionEventType, List[ResolutionEvent]] = {}
+        for event in self.get_events():
+            if event.event_type not in events_by_type:
+                events_by_type[event.event_type] = [event]
+            else:
+                events_by_type[event.event_type].append(event)
+
+        lines = []
+        for event_type in ResolutionEventType:
+            if event_type not in events_by_type:
+                continue
+            events = sorted(events_by_type[event_type], key=lambda e: e.file)
+            lines.append(f"NOTE: {event_type.value} - {len(events)} page(s):")
+            for event in events:
+                abbrev_file = get_abbrev_path(event.file)
+                lines.append(f'    {event.page_num} ({event.page_type.name}): "{abbrev_file}"')
+
+        return "\n".join(lines)
+
+    def log_summary(self, log_level: int = logging.INFO) -> None:
+        if not self._events or not logging.getLogger().isEnabledFor(log_level):
+            return
+
+        logging.log(log_level, "Page resolution summary:\n" + self.get_summary_report())
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .comic_book import ComicBook, PageVariant
+from .comics_consts import PageType
+from .comics_utils import get_abbrev_path, write_json_file
+
+RESOLUTION_PLAN_FORMAT_VERSION = 1
+RESOLUTION_PLAN_FILENAME = "resolution-plan.json"
+
+
+@dataclass
+class PlannedPage:
+    page_num: str
+    page_type: PageType
+    file: str
+    is_modified: bool
+
+
+# Records which file (original, fixes, restored, restored fixes or added page) was
+# chosen for each page of a comic. Which file gets chosen only depends on which files
+# exist, so the plan stays valid for as long as the mtimes of the directories
+# involved are unchanged.
+@dataclass
+class ResolutionPlan:
+    ini_file: str
+    page_types: List[PageType]
+    dir_mtimes: Dict[str, int]
+    pages: List[PlannedPage]
+
+    def get_final_srce_story_files(self, page_types: List[PageType]) -> List[Tuple[str, bool]]:
+        return [(p.file, p.is_modified) for p in self.pages if p.page_type in page_types]
+
+    def is_valid_for(self, comic: ComicBook, page_types: List[PageType]) -> bool:
+        if self.ini_file != comic.ini_file:
+            return False
+        if set(self.page_types) != set(page_types):
+            return False
+
+        comic_pages = [
+            (page.page_filenames, page.page_type)
+            for page in comic.page_images_in_order.get_pages_of_type(page_types)
+        ]
+        if comic_pages != [(p.page_num, p.page_type) for p in self.pages]:
+            return False
+
+        return self.dir_mtimes == _get_dir_mtimes(comic)
+
+
+def get_resolution_plan_file(work_dir: str) -> str:
+    return os.path.join(work_dir, RESOLUTION_PLAN_FILENAME)
+
+
+def get_resolution_plan(
+    comic: ComicBook, page_types: List[PageType], plan_file: str
+) -> ResolutionPlan:
+    plan = load_resolution_plan(plan_file)
+    if plan is not None and plan.is_valid_for(comic, page_types):
+        logging.debug(f'Using resolution plan "{get_abbrev_path(plan_file)}".')
+        return plan
+
+    plan = make_resolution_plan(comic, page_types)
+    save_resolution_plan(plan, plan_file)
+
+    return plan
+
+
+def make_resolution_plan(comic: ComicBook, page_types: List[PageType]) -> ResolutionPlan:
+    # Get the mtimes before resolving so that any changes made during
+    # resolution will invalidate the plan.
+    dir_mtimes = _get_dir_mtimes(comic)
+
+    comic.refresh_manifest()
+    pages = [
+        PlannedPage(
+            v.page.page_filenames,
+            v.page.page_type,
+            v.files[PageVariant.FINAL_SRCE],
+            PageVariant.FINAL_SRCE in v.modified,
+        )
+        for v in comic.get_page_variant_files(page_types, PageVariant.FINAL_SRCE)
+    ]
+
+    return ResolutionPlan(comic.ini_file, list(page_types), dir_mtimes, pages)
+
+
+def save_resolution_plan(plan: ResolutionPlan, plan_file: str) -> None:
+    plan_json = {
+        "format_version": RESOLUTION_PLAN_FORMAT_VERSION,
+        "ini_file": plan.ini_file,
+        "page_types": [page_type.name for page_type in plan.page_types],
+        "dir_mtimes": plan.dir_mtimes,
+        "pages": [[p.page_num, p.page_type.name, p.file, p.is_modified] for p in plan.pages],
+    }
+
+    write_json_file(plan_file, plan_json)
+
+
+def load_resolution_plan(plan_file: str) -> Optional[ResolutionPlan]:
+    if not os.path.isfile(plan_file):
+        return None
+
+    try:
+        with open(plan_file, "r") as f:
+            plan_json: Dict[str, Any] = json.load(f)
+        if plan_json["format_version"] != RESOLUTION_PLAN_FORMAT_VERSION:
+            return None
+
+        return ResolutionPlan(
+            plan_json["ini_file"],
+            [PageType[name] for name in plan_json["page_types"]],
+            plan_json["dir_mtimes"],
+            [
+                PlannedPage(page_num, PageType[page_type], file, is_modified)
+                for page_num, page_type, file, is_modified in plan_json["pages"]
+            ],
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        logging.warning(f'Could not load resolution plan "{plan_file}": {e}')
+        return None
+
+
+def _get_dir_mtimes(comic: ComicBook) -> Dict[str, int]:
+    plan_dirs = [
+        comic.get_srce_image_dir(),
+        comic.get_srce_fixes_image_dir(),
+        comic.get_srce_restored_image_dir(),
+        comic.get_srce_restored_fixes_image_dir(),
+    ]
+
+    return {plan_dir: _get_dir_mtime_ns(plan_dir) for plan_dir in plan_dirs}
+
+
+def _get_dir_mtime_ns(dirname: str) -> int:
+    try:
+        return os.stat(dirname).st_mtime_ns
+    except FileNotFoundError:
+        return -1
@@ -0,0 +1,213 @@
+import collections
+import logging
+import os
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .comics_consts import STORY_PAGE_TYPES, PageType
+from .comics_database import ComicsDatabase
+from .comics_utils import get_abbrev_path, write_json_file
+from .panel_segmentation import PanelSegmenter
+
+DEFAULT_SEGMENTATION_MAX_WORKERS = 4
+DEFAULT_SEGMENTATION_MAX_RETRIES = 2
+WORKER_DIED_ERROR = "A segmentation worker process died."
+
+# Must be picklable (a class, module level function or 'functools.partial') as it is
+# called in each worker process.
+SegmenterFactory = Callable[[], PanelSegmenter]
+
+
+@dataclass
+class SegmentationJob:
+    srce_file: str
+    segments_file: str
+
+
+@dataclass
+class SegmentationJobs:
+    jobs: List[SegmentationJob] = field(default_factory=list)
+    # Story title -> why none of its pages could be made into jobs.
+    title_failures: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class SegmentationReport:
+    num_pages: int = 0
+    num_segmented: int = 0
+    num_up_to_date: int = 0
+    num_retries: int = 0
+    elapsed_secs: float = 0.0
+    failures: Dict[str, str] = field(default_factory=dict)
+    title_failures: Dict[str, str] = field(default_factory=dict)
+
+    def get_pages_per_sec(self) -> float:
+        return self.num_segmented / self.elapsed_secs if self.elapsed_secs > 0 else 0.0
+
+    def get_summary(self) -> str:
+        return (
+            f"Segmented {self.num_segmented} of {self.num_pages} pages"
+            f" ({self.num_up_to_date} up to date, {len(self.failures)} failed,"
+            f" {self.num_retries} retries, {len(self.title_failures)} titles skipped)"
+            f" in {self.elapsed_secs:.1f}s - {self.get_pages_per_sec():.2f} pages/s."
+        )
+
+
+# A title whose pages can't all be resolved (e.g. one hasn't been restored yet) is
+# recorded as a failure, and the other titles still get their jobs.
+def get_segmentation_jobs(
+    comics_database: ComicsDatabase,
+    titles: List[str],
+    page_types: Optional[List[PageType]] = None,
+) -> SegmentationJobs:
+    if page_types is None:
+        page_types = STORY_PAGE_TYPES
+
+    segmentation_jobs = SegmentationJobs()
+    for title in titles:
+        try:
+            comic = comics_database.get_comic_book(title)
+            srce_files = comic.get_final_srce_story_files(page_types)
+            segments_files = comic.get_srce_panel_segments_files(page_types)
+        except Exception as e:
+            logging.error(f'Could not get segmentation jobs for "{title}": {e}')
+            segmentation_jobs.title_failures[title] = str(e)
+            continue
+
+        assert len(srce_files) == len(segments_files)
+        segmentation_jobs.jobs.extend(
+            SegmentationJob(srce_file, segments_file)
+            for (srce_file, _), segments_file in zip(srce_files, segments_files)
+        )
+
+    return segmentation_jobs
+
+
+def get_volume_segmentation_jobs(
+    comics_database: ComicsDatabase,
+    volume_nums: List[int],
+    page_types: Optional[List[PageType]] = None,
+) -> SegmentationJobs:
+    titles = comics_database.get_all_story_titles_in_fantagraphics_volume(volume_nums)
+    return get_segmentation_jobs(comics_database, titles, page_types)
+
+
+def is_segments_file_up_to_date(job: SegmentationJob) -> bool:
+    if not os.path.isfile(job.segments_file):
+        return False
+    return os.path.getmtime(job.segments_file) >= os.path.getmtime(job.srce_file)
+
+
+# Errors that may not happen again: a worker or kumiko process dying or timing out, or
+# an i/o error other than a missing or inaccessible file. Anything else, such as an
+# unreadable image, would only fail again, so is not retried.
+def is_transient_segmentation_error(e: Exception) -> bool:
+    if isinstance(e, (FileNotFoundError, IsADirectoryError, NotADirectoryError, PermissionError)):
+        return False
+    if isinstance(e, subprocess.CalledProcessError):
+        # Killed by a signal - e.g. out of memory.
+        return e.returncode < 0
+
+    return isinstance(e, (OSError, subprocess.TimeoutExpired))
+
+
+# Segments pages on a pool of processes, each with its own segmenter made by
+# 'segmenter_factory'. At most 'max_workers' pages are in flight at once. A page that
+# fails with a transient error is retried up to 'max_retries' times before it is
+# reported as failed. If a worker process dies, the pages in flight are reported as
+# failed and the rest carry on in a new pool. Pages whose segments file is newer than
+# the srce file are skipped unless 'force' is set.
+def run_segmentation(
+    segmentation_jobs: SegmentationJobs,
+    segmenter_factory: SegmenterFactory,
+    max_workers: int = DEFAULT_SEGMENTATION_MAX_WORKERS,
+    max_retries: int = DEFAULT_SEGMENTATION_MAX_RETRIES,
+    force: bool = False,
+) -> SegmentationReport:
+    start = time.time()
+    jobs = segmentation_jobs.jobs
+    report = SegmentationReport(
+        num_pages=len(jobs), title_failures=dict(segmentation_jobs.title_failures)
+    )
+
+    pending = collections.deque(
+        (job, 0) for job in jobs if force or not is_segments_file_up_to_date(job)
+    )
+    report.num_up_to_date = len(jobs) - len(pending)
+
+    while pending:
+        _run_segmentation_pool(pending, segmenter_factory, max_workers, max_retries, report)
+
+    report.elapsed_secs = time.time() - start
+    logging.info(report.get_summary())
+
+    return report
+
+
+# Runs pending jobs until they are all done or the pool breaks.
+def _run_segmentation_pool(
+    pending: Deque[Tuple[SegmentationJob, int]],
+    segmenter_factory: SegmenterFactory,
+    max_workers: int,
+    max_retries: int,
+    report: SegmentationReport,
+) -> None:
+    def add_failure(failed_job: SegmentationJob, error: str) -> None:
+        logging.error(f'Could not segment "{get_abbrev_path(failed_job.srce_file)}": {error}')
+        report.failures[failed_job.srce_file] = error
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(segmenter_factory,),
+    ) as executor:
+        running: Dict[Future, Tuple[SegmentationJob, int]] = {}
+
+        while pending or running:
+            while pending and len(running) < max_workers:
+                job, num_tries = pending.popleft()
+                running[executor.submit(_segment_page, job)] = (job, num_tries)
+
+            is_pool_broken = False
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, num_tries = running.pop(future)
+                try:
+                    future.result()
+                    report.num_segmented += 1
+                except BrokenProcessPool:
+                    is_pool_broken = True
+                    add_failure(job, WORKER_DIED_ERROR)
+                except Exception as e:
+                    if num_tries < max_retries and is_transient_segmentation_error(e):
+                        logging.warning(
+                            f'Retrying segmentation of "{get_abbrev_path(job.srce_file)}": {e}'
+                        )
+                        report.num_retries += 1
+                        pending.append((job, num_tries + 1))
+                    else:
+                        add_failure(job, str(e))
+
+            if is_pool_broken:
+                for job, _ in running.values():
+                    add_failure(job, WORKER_DIED_ERROR)
+                return
+
+
+_worker_segmenter: Optional[PanelSegmenter] = None
+
+
+def _init_worker(segmenter_factory: SegmenterFactory) -> None:
+    global _worker_segmenter
+    _worker_segmenter = segmenter_factory()
+
+
+def _segment_page(job: SegmentationJob) -> None:
+    segment_info = _worker_segmenter.get_panels_segment_info(None, job.srce_file)
+
+    os.makedirs(os.path.dirname(job.segments_file), exist_ok=True)
+    write_json_file(job.segments_file, segment_info)
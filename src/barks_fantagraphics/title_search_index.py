@@ -0,0 +1,91 @@
+import bisect
+import heapq
+from difflib import SequenceMatcher, get_close_matches
+from typing import Dict, Iterable, List, Set
+
+NGRAM_SIZE = 3
+MAX_RESCORED_CANDIDATES = 10
+
+
+# Trigram index over a fixed set of titles. Candidates sharing the most trigrams
+# with a query are found via the index, then only the best few are re-scored with
+# 'SequenceMatcher', using the same ratio and cutoff as 'difflib.get_close_matches'.
+# This is an approximation of a full 'difflib' scan: a title that trigrams rank
+# poorly is never re-scored, so where several titles have the same ratio the one
+# returned can differ from the one 'difflib' would return. Only if none of the
+# candidates is close enough are all the titles scanned, as 'difflib' does.
+class TitleSearchIndex:
+    def __init__(self, titles: Iterable[str]):
+        self._titles = sorted(set(titles))
+        self._num_ngrams: List[int] = []
+        self._ngram_index: Dict[str, List[int]] = {}
+        for title_index, title in enumerate(self._titles):
+            ngrams = _get_ngrams(title)
+            self._num_ngrams.append(len(ngrams))
+            for ngram in ngrams:
+                if ngram not in self._ngram_index:
+                    self._ngram_index[ngram] = [title_index]
+                else:
+                    self._ngram_index[ngram].append(title_index)
+
+        self._lower_titles = sorted((title.lower(), title) for title in self._titles)
+
+    def get_close_matches(self, query: str, n: int = 3, cutoff: float = 0.6) -> List[str]:
+        query_ngrams = _get_ngrams(query)
+
+        num_shared: Dict[int, int] = {}
+        for ngram in query_ngrams:
+            for title_index in self._ngram_index.get(ngram, []):
+                num_shared[title_index] = num_shared.get(title_index, 0) + 1
+        if not num_shared:
+            return self._get_all_close_matches(query, n, cutoff)
+
+        # Rank by the Dice coefficient of the trigram sets, keeping any candidates that
+        # tie with the last one so the cut doesn't depend on the order of the titles.
+        def get_dice_score(i: int) -> float:
+            return 2.0 * num_shared[i] / (len(query_ngrams) + self._num_ngrams[i])
+
+        ranked = sorted(num_shared, key=get_dice_score, reverse=True)
+        num_candidates = min(len(ranked), max(n, MAX_RESCORED_CANDIDATES))
+        min_score = get_dice_score(ranked[num_candidates - 1])
+        while num_candidates < len(ranked) and get_dice_score(ranked[num_candidates]) >= min_score:
+            num_candidates += 1
+        candidates = ranked[:num_candidates]
+
+        matcher = SequenceMatcher()
+        matcher.set_seq2(query)
+        matches = []
+        for title_index in candidates:
+            title = self._titles[title_index]
+            matcher.set_seq1(title)
+            if (
+                matcher.real_quick_ratio() >= cutoff
+                and matcher.quick_ratio() >= cutoff
+                and matcher.ratio() >= cutoff
+            ):
+                matches.append((matcher.ratio(), title))
+
+        if not matches:
+            return self._get_all_close_matches(query, n, cutoff)
+
+        return [title for _, title in heapq.nlargest(n, matches)]
+
+    def _get_all_close_matches(self, query: str, n: int, cutoff: float) -> List[str]:
+        return get_close_matches(query, self._titles, n, cutoff)
+
+    def get_completions(self, prefix: str, n: int = 10) -> List[str]:
+        lower_prefix = prefix.lower()
+
+        completions = []
+        start = bisect.bisect_left(self._lower_titles, (lower_prefix, ""))
+        for lower_title, title in self._lower_titles[start : start + n]:
+            if not lower_title.startswith(lower_prefix):
+                break
+            completions.append(title)
+
+        return completions
+
+
+def _get_ngrams(text: str) -> Set[str]:
+    padded = " " * (NGRAM_SIZE - 1) + text.lower() + " "
+    return {padded[i : i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
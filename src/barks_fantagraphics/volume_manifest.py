@@ -0,0 +1,76 @@
+import contextlib
+import os
+from typing import Dict, FrozenSet, Iterator, Optional, Set, Tuple
+
+# Directory listing with the directory's mtime when it was read, or None if the
+# directory did not exist.
+DirListing = Tuple[Optional[int], FrozenSet[str]]
+
+
+# Listing of the files in a Fantagraphics volume's variant directories (images,
+# fixes, restored, upscayled, bounded, etc.). Each directory is read with a single
+# 'os.scandir' and file existence checks are then set lookups. A listing is read
+# again when the directory's mtime changes, which costs one stat of the directory
+# per check - or, inside a 'batch', one stat per directory for the whole batch.
+class VolumeManifest:
+    def __init__(self, volume: int):
+        self._volume = volume
+        self._dir_listings: Dict[str, DirListing] = {}
+        self._batch_checked_dirs: Optional[Set[str]] = None
+
+    def get_volume(self) -> int:
+        return self._volume
+
+    def is_file(self, file: str) -> bool:
+        dirname, filename = os.path.split(file)
+        return filename in self.get_files(dirname)
+
+    def get_files(self, dirname: str) -> FrozenSet[str]:
+        listing = self._dir_listings.get(dirname)
+        if listing is not None and self._batch_checked_dirs is not None:
+            if dirname in self._batch_checked_dirs:
+                return listing[1]
+
+        mtime_ns = _get_dir_mtime_ns(dirname)
+        if listing is None or listing[0] != mtime_ns:
+            listing = (mtime_ns, _scan_dir(dirname))
+            self._dir_listings[dirname] = listing
+        if self._batch_checked_dirs is not None:
+            self._batch_checked_dirs.add(dirname)
+
+        return listing[1]
+
+    # Within the batch each directory is only checked for changes once, so files added
+    # or removed during the batch may not be seen.
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[None]:
+        if self._batch_checked_dirs is not None:
+            yield
+            return
+
+        self._batch_checked_dirs = set()
+        try:
+            yield
+        finally:
+            self._batch_checked_dirs = None
+
+    def refresh(self, dirname: str = "") -> None:
+        if not dirname:
+            self._dir_listings.clear()
+        else:
+            self._dir_listings.pop(dirname, None)
+
+
+def _get_dir_mtime_ns(dirname: str) -> Optional[int]:
+    try:
+        return os.stat(dirname).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _scan_dir(dirname: str) -> FrozenSet[str]:
+    try:
+        with os.scandir(dirname) as entries:
+            return frozenset(entry.name for entry in entries if entry.is_file())
+    except (FileNotFoundError, NotADirectoryError):
+        return frozenset()